@@ -0,0 +1,75 @@
+"""
+Denormalized counters, e.g. Recipe.favorites_count.
+
+Counters are changed with F() expressions, so concurrent updates don't
+overwrite each other. Decrements stop at zero: rows loaded as fixtures
+aren't counted, so their deletion must not break the >= 0 constraint.
+recount_counters management command repairs drift.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def changed_value(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_counter(model, field, pk, delta):
+    model.objects.filter(pk=pk).update(**{field: changed_value(field, delta)})
+
+
+def change_counters(model, field, deltas):
+    """Apply {pk: delta} (or +1 per pk of iterable) to counter of many
+    rows, one UPDATE per distinct delta."""
+    grouped = defaultdict(list)
+    for pk, delta in Counter(deltas).items():
+        if delta:
+            grouped[delta].append(pk)
+    for delta, pks in grouped.items():
+        model.objects.filter(pk__in=pks).update(
+            **{field: changed_value(field, delta)})
+
+
+def count_subquery(related_model, related_field):
+    """Number of related_model rows referencing outer row by
+    related_field."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def recount(model, field, related_model, related_field):
+    """Fix counter of rows where it differs from actual number of
+    related rows. Returns number of fixed rows."""
+    actual = count_subquery(related_model, related_field)
+    drifted = model.objects.annotate(actual=actual).exclude(
+        **{field: F('actual')})
+    return model.objects.filter(pk__in=drifted.values('pk')).update(
+        **{field: actual})
+
+
+class CountersMixin:
+    """
+    Model with counter_fields changed only by change_counter(s). Ordinary
+    saves of existing rows don't write counters, so stale values loaded
+    with the object don't overwrite concurrent changes.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
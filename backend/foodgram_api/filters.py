@@ -0,0 +1,12 @@
+from rest_framework.filters import OrderingFilter
+
+
+class StableOrderingFilter(OrderingFilter):
+    """Ordering filter which breaks ties by id, so pages don't overlap
+    when many rows have equal values, e.g. zero counters."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering = (*ordering, '-id')
+        return ordering
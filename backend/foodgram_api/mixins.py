@@ -1,39 +1,223 @@
+import hashlib
+
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import sql
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import quote_etag
+
+from .counters import change_counters
+from .serializers import IdListSerializer
+from .versions import get_version
+
+
+def get_insert_query(obj):
+    model = type(obj)
+    query = sql.InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(
+        [field for field in model._meta.local_concrete_fields
+         if field is not model._meta.auto_field], [obj])
+    return query
+
+
+def execute_insert(query, using):
+    """Run INSERT query, returns whether row was inserted."""
+    inserted = False
+    with connections[using].cursor() as cursor:
+        for statement, params in query.get_compiler(using).as_sql():
+            cursor.execute(statement, params)
+            inserted = cursor.rowcount > 0
+    return inserted
+
+
+def supports_returning(connection):
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35))
+
+
+def change_links(model, user_id, field, ids, adding):
+    """
+    Insert (skipping existing) or delete rows of model linking user to
+    objects with ids in field. Returns ids of rows actually inserted or
+    deleted, as reported by the statements themselves, so a change made
+    by a concurrent request is never counted twice. Signals are not sent.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if not ids:
+        return []
+    if not supports_returning(connection):
+        # one statement per id, its affected rows count tells the result
+        if adding:
+            return [pk for pk in ids if execute_insert(get_insert_query(
+                model(user_id=user_id, **{field: pk})), using)]
+        links = model.objects.filter(user_id=user_id)
+        return [pk for pk in ids
+                if links.filter(**{field: pk})._raw_delete(using)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    user_column = quote(model._meta.get_field('user').column)
+    column = quote(model._meta.get_field(field).column)
+    if adding:
+        statement = (
+            f'INSERT INTO {table} ({user_column}, {column}) VALUES '
+            f'{", ".join(["(%s, %s)"] * len(ids))} '
+            f'ON CONFLICT DO NOTHING RETURNING {column}')
+        params = [param for pk in ids for param in (user_id, pk)]
+    else:
+        statement = (
+            f'DELETE FROM {table} WHERE {user_column} = %s AND {column} '
+            f'IN ({", ".join(["%s"] * len(ids))}) RETURNING {column}')
+        params = [user_id, *ids]
+    with connection.cursor() as cursor:
+        cursor.execute(statement, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def insert_or_ignore(obj):
+    """
+    Insert obj with INSERT ... ON CONFLICT DO NOTHING (INSERT OR IGNORE
+    on SQLite). Returns True if row was inserted and sends post_save then,
+    False if it already existed. Insert and signal handlers run in one
+    transaction (the caller's one if any, without a savepoint).
+    """
+    model = type(obj)
+    using = router.db_for_write(model)
+    query = get_insert_query(obj)
+    with transaction.atomic(using=using, savepoint=False):
+        inserted = execute_insert(query, using)
+        if inserted:
+            post_save.send(sender=model, instance=obj, created=True,
+                           update_fields=None, raw=False, using=using)
+    return inserted
+
+
+def delete_by_filter(model, **kwargs):
+    """
+    Delete rows with one DELETE statement. Returns number of deleted
+    rows and sends post_delete for them, with instances built from kwargs.
+    Delete and signal handlers run in one transaction, as in
+    insert_or_ignore.
+    """
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using, savepoint=False):
+        deleted = model.objects.filter(**kwargs)._raw_delete(using)
+        for _ in range(deleted):
+            post_delete.send(sender=model, instance=model(**kwargs),
+                             using=using)
+    return deleted
 
 
 class CreateDeleteObjMixin:
+    """
+    Add and remove rows linking user to an object (favorites, shopping
+    cart, subscriptions). Each change is one statement and its result
+    is decided by affected rows count, so concurrent requests don't fail.
+    """
 
     def create_obj(self, request, create_data):
-        data = {
-            'user': request.user.id,
-            create_data['field_name']: create_data['id']
-        }
-        context = {
-            'request': request,
-            'exist_err_msg': create_data['err_msg']
-        }
-        serializer = create_data['serializer'](data=data, context=context)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        subj = create_data['subj']
+        obj = create_data['obj_model'](
+            user=request.user, **{create_data['field_name']: subj})
+        if not insert_or_ignore(obj):
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [create_data['err_msg']]})
+        serializer = create_data['serializer'](
+            subj, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_obj(self, request, delete_data):
-        subj = get_object_or_404(
-            delete_data['subj_model'], id=delete_data['id'])
-        obj_model = delete_data['obj_model']
-        del_error_msg = delete_data['err_msg']
-        del_success_msg = delete_data['success_msg']
+        kwargs = {
+            'user_id': request.user.id,
+            f'{delete_data["field_name"]}_id': delete_data['id']}
         try:
-            kwargs = {
-                'user': request.user,
-                delete_data['field_name']: subj}
-            obj_model.objects.get(**kwargs).delete()
-        except ObjectDoesNotExist:
-            data = {'errors': del_error_msg}
+            deleted = delete_by_filter(delete_data['obj_model'], **kwargs)
+        except (TypeError, ValueError):
+            raise Http404
+        if not deleted:
+            get_object_or_404(
+                delete_data['subj_model'], id=delete_data['id'])
+            data = {'errors': delete_data['err_msg']}
             return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
-        del_data = {'info': del_success_msg}
+        del_data = {'info': delete_data['success_msg']}
         return Response(data=del_data, status=status.HTTP_204_NO_CONTENT)
+
+    def change_objs(self, request, batch_data):
+        """
+        Add (POST) or remove (DELETE) links to many objects at once, ids
+        are passed as {"ids": [...]}. Rows are changed with bulk statements
+        in one transaction, result is reported for every id. Counters
+        follow rows the statements actually changed.
+        """
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        obj_model = batch_data['obj_model']
+        subj_model = batch_data['subj_model']
+        field = f'{batch_data["field_name"]}_id'
+        adding = request.method == 'POST'
+        with transaction.atomic():
+            found = set(subj_model.objects.filter(
+                id__in=ids).values_list('id', flat=True))
+            changed = set(change_links(
+                obj_model, request.user.id, field,
+                [pk for pk in ids if pk in found], adding))
+            change_counters(subj_model, batch_data['counter'],
+                            {pk: 1 if adding else -1 for pk in changed})
+        statuses = ('added', 'exists') if adding else ('removed', 'missing')
+        results = [{
+            'id': pk,
+            'status': ('not_found' if pk not in found
+                       else statuses[0] if pk in changed else statuses[1])
+        } for pk in ids]
+        return Response({'results': results})
+
+
+class VersionedCacheMixin:
+    """
+    Serve list and retrieve of rarely changed data from process cache
+    and answer conditional requests with 304. Cached payloads and ETags
+    depend on version stamp version_name, bump it when data changes.
+    """
+    version_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        version = get_version(self.version_name)
+        key = hashlib.md5(
+            f'{self.version_name}:{version}:{request.get_full_path()}'.encode()
+        ).hexdigest()
+        etag = quote_etag(key)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = cache.get(key)
+            if data is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.REFERENCE_DATA_MAX_AGE)
+        patch_vary_headers(response, ('Accept',))
+        return response
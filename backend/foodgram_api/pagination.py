@@ -1,5 +1,250 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def get_estimated_count(queryset):
+    """Planner estimate of rows count, None if database can't tell."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(queryset):
+    """
+    Count rows of queryset, caching result per query for a short time.
+    Large results are counted from planner estimate instead of COUNT(*).
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = 'count-' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = get_estimated_count(queryset)
+        if count is None or count < settings.PAGINATION_ESTIMATE_THRESHOLD:
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_TTL)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        return get_count(self.object_list)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate by position in ordering instead of OFFSET, so any page costs
+    the same as the first one. Last ordering field must be unique. Rows
+    may be model instances or values() dicts.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+        self.fields = [field.lstrip('-') for field in ordering]
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=settings.MAX_PAGE_SIZE)
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+
+    def encode_cursor(self, row, reverse):
+        position = [
+            str(row[field] if isinstance(row, dict) else getattr(row, field))
+            for field in self.fields]
+        cursor = json.dumps({'p': position, 'r': reverse})
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, queryset, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = [
+                queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, cursor['p'])]
+            if len(position) != len(self.fields):
+                raise ValueError
+            return position, bool(cursor['r'])
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_position_filter(self, position, reverse):
+        condition = Q()
+        for number, field in enumerate(self.fields):
+            descending = self.ordering[number].startswith('-')
+            lookup = 'gt' if descending == reverse else 'lt'
+            step = Q(**{f'{field}__{lookup}': position[number]})
+            for previous, value in zip(self.fields, position[:number]):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(queryset, request)
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}'
+                        for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(position, reverse))
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = page
+        return page
+
+    def get_link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page number pagination with limit query param. Counts are cached for
+    a short time, ?count=false skips counting and returns only links.
+    Views with keyset_ordering also paginate by cursor, if ?cursor= (maybe
+    empty for the first page) is passed and ordering is not changed by
+    query params, including ranking of ?search=.
+    """
+    django_paginator_class = CachedCountPaginator
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    count_query_param = 'count'
+    keyset_ordering = None
+    ordering_params = (api_settings.ORDERING_PARAM, api_settings.SEARCH_PARAM)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        self.countless = False
+        if (self.keyset_ordering is not None
+                and KeysetPagination.cursor_query_param
+                in request.query_params
+                and not any(param in request.query_params
+                            for param in self.ordering_params)):
+            self.keyset = KeysetPagination(self.keyset_ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        count = request.query_params.get(self.count_query_param)
+        if count in ('false', '0'):
+            return self.paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_without_count(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            self.number = _positive_int(
+                request.query_params.get(self.page_query_param, 1),
+                strict=True)
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='Неверный номер страницы.'))
+        offset = (self.number - 1) * page_size
+        page = list(queryset[offset:offset + page_size + 1])
+        self.countless = True
+        self.has_next = len(page) > page_size
+        self.request = request
+        return page[:page_size]
+
+    def get_next_link(self):
+        if not self.countless:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.page_query_param, self.number + 1)
+
+    def get_previous_link(self):
+        if not self.countless:
+            return super().get_previous_link()
+        url = self.request.build_absolute_uri()
+        if self.number == 1:
+            return None
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param,
+                                   self.number - 1)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        if self.countless:
+            return Response(OrderedDict([
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CustomPagination):
+    keyset_ordering = ('-pub_date', '-id')
+    ordering_params = (*CustomPagination.ordering_params, 'pantry')
+
+
+class UserPagination(CustomPagination):
+    keyset_ordering = ('-id',)
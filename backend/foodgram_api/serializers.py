@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+from django.conf import settings
+
+
+class IdListSerializer(serializers.Serializer):
+    """List of object ids for batch actions."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MAX_BATCH_SIZE)
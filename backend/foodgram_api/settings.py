@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 from rest_framework import permissions
@@ -12,7 +13,7 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'temp_value')
 
 DEBUG = (os.getenv('DEBUG', 'False') == 'True')
 
-ALLOWED_HOSTS = (os.getenv('ALLOWED_HOSTS')).split()
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost').split()
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -72,6 +73,18 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shopping_lists': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shopping-lists',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -135,4 +148,42 @@ DJOSER = {
 
 FONTS_PATH = os.path.join(BASE_DIR, 'fonts')
 
+SHARED_STATE_DIR = os.getenv(
+    'SHARED_STATE_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram'))
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+REFERENCE_DATA_MAX_AGE = 60
+
 DEFAULT_RECIPES_LIMIT = 10
+
+MAX_PAGE_SIZE = 100
+
+MAX_BATCH_SIZE = 100
+
+PAGINATION_COUNT_TTL = 30
+
+PAGINATION_ESTIMATE_THRESHOLD = 100000
+
+IMAGE_PROCESSING_ASYNC = True
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+IMAGE_PROCESSING_QUEUE_SIZE = 16
+
+IMAGE_PROCESSING_TIMEOUT = 15 * 60
+
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+
+FEED_LENGTH = 500
+
+FEED_BATCH_SIZE = 1000
+
+RECIPE_INDEX_MARGIN = 60
+
+RECIPE_INDEX_MAX_CHANGES = 1000
+
+PANTRY_SEARCH_LIMIT = 1000
+
+INGREDIENT_FILTER_LIMIT = 1000
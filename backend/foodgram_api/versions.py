@@ -0,0 +1,34 @@
+"""
+Version stamps of reference data shared by all workers on the host.
+
+Each stamp is a small file in SHARED_STATE_DIR. Workers compare stamps with
+the ones their local caches were built for, so a change committed in one
+worker invalidates caches in the others.
+"""
+import os
+import uuid
+
+from django.conf import settings
+
+INITIAL_VERSION = '0'
+
+
+def get_version_path(name):
+    return os.path.join(settings.SHARED_STATE_DIR, f'{name}.version')
+
+
+def get_version(name):
+    try:
+        with open(get_version_path(name)) as file:
+            return file.read() or INITIAL_VERSION
+    except FileNotFoundError:
+        return INITIAL_VERSION
+
+
+def bump_version(name):
+    os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+    path = get_version_path(name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write(uuid.uuid4().hex)
+    os.replace(tmp_path, path)
@@ -9,40 +9,46 @@ class RecipeIngredientInline(admin.TabularInline):
     verbose_name = 'Ингредиент'
     verbose_name_plural = 'Ингредиенты'
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('pk', 'name', 'measurement_unit')
     search_fields = ('name',)
-    inlines = (RecipeIngredientInline,)
+    show_full_result_count = False
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'author')
+    list_display = ('pk', 'name', 'author', 'favorites_count')
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username')
-    readonly_fields = ('pub_date', 'in_favorites')
-    list_filter = ('author', 'tags__name')
+    readonly_fields = ('pub_date', 'image_variants_ready', 'favorites_count',
+                       'in_carts_count')
+    list_filter = ('tags',)
     filter_horizontal = ('tags',)
+    autocomplete_fields = ('author',)
     inlines = (RecipeIngredientInline,)
-
-    def in_favorites(self, obj):
-        return obj.favor_recipe.count()
-
-    in_favorites.short_description = 'Добавили в избранное'
+    show_full_result_count = False
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(Tag)
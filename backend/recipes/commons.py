@@ -1,20 +1,53 @@
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from django.conf import settings
+
+from .images import get_image_variants
 from .models import Recipe
 
 
+class Base64ImageDataField(serializers.CharField):
+    """
+    Image as base64 string or data URI. Only header and size are checked
+    here, image itself is decoded later in image processing pool.
+    """
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+    }
+
+    def to_internal_value(self, data):
+        data = super().to_internal_value(data)
+        header, _, data = data.rpartition(';base64,')
+        if header and not header.startswith('data:image/'):
+            self.fail('invalid_image')
+        if not data:
+            self.fail('invalid_image')
+        if len(data) * 3 // 4 > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.fail('max_size', max_size=settings.MAX_IMAGE_UPLOAD_SIZE)
+        return data
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of resized copies of recipe image in jpeg and webp, null
+    until they are generated."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image or not recipe.image_variants_ready:
+            return None
+        return get_image_variants(
+            recipe.image.name, self.context.get('request'))
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(required=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-
-
-class ShowRecipeSerializerMixin:
-
-    def to_representation(self, instance):
-        return ShortRecipeSerializer(
-            instance.recipe,
-            context=self.context).data
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
@@ -1,7 +1,18 @@
+from django import forms
 from django.db.models import Q
 from django_filters import rest_framework as filters
 
+from .indexes import filter_by_ingredients
 from .models import Ingredient, Recipe, Tag
+from .search import search
+
+
+class IntegerFilter(filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(filters.BaseInFilter, IntegerFilter):
+    pass
 
 
 class IngredientStartFilter(filters.FilterSet):
@@ -17,13 +28,21 @@ class IngredientStartFilter(filters.FilterSet):
 
 class RecipeFilter(filters.FilterSet):
     """Filter Recipe by tags(slug), by author (id), by present in
-    shopping cart (bool) and present in favorite of current user (bool)."""
+    shopping cart (bool), present in favorite of current user (bool), by
+    full-text search in name and text, ranked by relevance, and by
+    ingredients (ids, comma separated): ingredients - all of them,
+    exclude_ingredients - none of them, pantry - ranked by number of
+    used pantry ingredients."""
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all())
     is_favorited = filters.BooleanFilter(method='get_in_favorite')
     is_in_shopping_cart = filters.BooleanFilter(method='get_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
+    ingredients = IntegerInFilter(method='get_by_ingredients')
+    exclude_ingredients = IntegerInFilter(method='get_by_ingredients')
+    pantry = IntegerInFilter(method='get_by_ingredients')
 
     class Meta:
         model = Recipe
@@ -40,3 +59,19 @@ class RecipeFilter(filters.FilterSet):
 
     def get_in_shopping_cart(self, queryset, name, value):
         return self.__get_in(queryset, name, value, 'shopping_recipe__user')
+
+    def get_search(self, queryset, name, value):
+        return search(queryset, value)
+
+    def get_by_ingredients(self, queryset, name, value):
+        """All three ingredient filters are applied at once, so pantry
+        ranking is limited to recipes matching the other two."""
+        if getattr(self, 'ingredients_filtered', False):
+            return queryset
+        self.ingredients_filtered = True
+        data = self.form.cleaned_data
+        return filter_by_ingredients(
+            queryset,
+            include=data.get('ingredients') or (),
+            exclude=data.get('exclude_ingredients') or (),
+            pantry=data.get('pantry') or ())
@@ -0,0 +1,148 @@
+import logging
+import os
+import tempfile
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# name, max size, crop to exact size
+VARIANTS = (
+    ('thumbnail', (96, 96), True),
+    ('card', (480, 480), False),
+    ('full', (1200, 1200), False),
+)
+# name, PIL format, extension, save options
+FORMATS = (
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True,
+                             'progressive': True}),
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+)
+
+# magic bytes of accepted upload formats
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+SNIFF_SIZE = 12
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+def sniff_image_format(header):
+    for signature, file_format in SIGNATURES:
+        if header.startswith(signature):
+            return file_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def save_upload(chunks, max_size):
+    """
+    Write uploaded image chunks to a temporary file and return its path.
+    Format is checked by first bytes and size is checked while writing,
+    so neither a wrong nor a huge upload is read to the end.
+    """
+    file = tempfile.NamedTemporaryFile(
+        dir=settings.FILE_UPLOAD_TEMP_DIR, suffix='.upload', delete=False)
+    size = 0
+    header = b''
+    try:
+        with file:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadError(
+                        f'Размер изображения не должен превышать '
+                        f'{max_size} байт.')
+                if len(header) < SNIFF_SIZE:
+                    header += chunk[:SNIFF_SIZE]
+                    if (len(header) >= SNIFF_SIZE
+                            and sniff_image_format(header) is None):
+                        raise UploadError('Неподдерживаемый формат.')
+                file.write(chunk)
+        if sniff_image_format(header) is None:
+            raise UploadError('Загрузите корректное изображение.')
+    except BaseException:
+        os.remove(file.name)
+        raise
+    return file.name
+
+
+def get_variant_name(image_name, variant, extension):
+    folder, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'variants', stem, f'{variant}.{extension}')
+
+
+def get_image_variants(image_name, request=None):
+    """URLs of every variant of image, computed without storage access."""
+    variants = {}
+    for variant, _, _ in VARIANTS:
+        variants[variant] = {}
+        for file_format, _, extension, _ in FORMATS:
+            url = default_storage.url(
+                get_variant_name(image_name, variant, extension))
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            variants[variant][file_format] = url
+    return variants
+
+
+def delete_image(image_name):
+    """Delete image with all its variants from storage."""
+    default_storage.delete(image_name)
+    for variant, _, _ in VARIANTS:
+        for _, _, extension, _ in FORMATS:
+            default_storage.delete(
+                get_variant_name(image_name, variant, extension))
+    folder = os.path.dirname(get_variant_name(image_name, 'full', 'jpg'))
+    try:
+        os.rmdir(default_storage.path(folder))
+    except (NotImplementedError, OSError):
+        # storage without local paths, or folder is not empty
+        pass
+
+
+def has_variants(image_name):
+    """Check the variant which is saved last."""
+    variant, _, _ = VARIANTS[-1]
+    _, _, extension, _ = FORMATS[-1]
+    return default_storage.exists(
+        get_variant_name(image_name, variant, extension))
+
+
+def generate_variants(image_name):
+    """Save resized and recompressed copies of image in every format."""
+    try:
+        with default_storage.open(image_name) as file:
+            source = ImageOps.exif_transpose(Image.open(file))
+            source.load()
+    except (OSError, ValueError) as error:
+        logger.warning('Could not read image %s: %s', image_name, error)
+        return False
+    source = source.convert('RGB')
+    for variant, size, crop in VARIANTS:
+        if crop:
+            image = ImageOps.fit(source, size, Image.LANCZOS)
+        else:
+            image = source.copy()
+            image.thumbnail(size, Image.LANCZOS)
+        for _, pil_format, extension, options in FORMATS:
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            name = get_variant_name(image_name, variant, extension)
+            default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    return True
@@ -0,0 +1,87 @@
+"""
+Helpers for bulk import commands: streaming readers of input files,
+batching and COPY into PostgreSQL tables.
+"""
+import csv
+import io
+import json
+import os
+import xml.etree.ElementTree as ET
+from itertools import islice
+
+from django.db import connection
+
+
+def read_jsonl(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+def read_json(file):
+    """JSON array of objects. Unlike other formats it is parsed whole."""
+    yield from json.load(file)
+
+
+def read_fixture_xml(file):
+    """Fields of objects from Django XML fixture. Parsed elements are
+    dropped at once, so memory doesn't grow with file size."""
+    events = ET.iterparse(file, events=('start', 'end'))
+    _, root = next(events)
+    for event, element in events:
+        if event == 'end' and element.tag == 'object':
+            yield {field.get('name'): field.text or ''
+                   for field in element.iter('field')}
+            root.clear()
+
+
+READERS = {
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+def get_file_format(path, file_format=None):
+    """Format from option or file extension."""
+    return file_format or os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def read_rows(path, readers, file_format=None):
+    """Yield rows of file one by one, file is never read at once."""
+    file_format = get_file_format(path, file_format)
+    if file_format not in readers:
+        raise ValueError(f'Неподдерживаемый формат файла: {file_format}.')
+    with open(path, encoding='utf-8', newline='') as file:
+        yield from readers[file_format](file)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def can_copy():
+    return connection.vendor == 'postgresql'
+
+
+def copy_rows(model, fields, rows):
+    """Insert rows into table of model with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(model._meta.get_field(field).column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote(model._meta.db_table)} ({columns}) '
+            f'FROM STDIN WITH (FORMAT csv)', buffer)
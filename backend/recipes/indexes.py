@@ -0,0 +1,342 @@
+import fcntl
+import heapq
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, When
+from django.utils import timezone
+
+from foodgram_api.versions import get_version
+from .models import Ingredient, Recipe, RecipeIngredient
+from .utils import INGREDIENTS_VERSION
+
+
+class IngredientPrefixIndex:
+    """
+    Sorted, casefolded snapshot of ingredients catalog for autocomplete.
+
+    File layout: header (magic, data version, count), ids and offsets
+    as uint32 arrays, then records "key\\0name\\0measurement_unit".
+    The file is memory-mapped read-only, so all workers share one copy
+    through the page cache.
+    """
+    MAGIC = b'FGI1'
+    HEADER = struct.Struct('<4s32sI')
+    SEPARATOR = b'\0'
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = self.HEADER.unpack_from(self.buffer)
+        if magic != self.MAGIC:
+            raise ValueError(f'{path} is not an ingredient index.')
+        self.version = version.rstrip(b'\0').decode()
+        ids_start = self.HEADER.size
+        offsets_start = ids_start + 4 * self.count
+        self.data_start = offsets_start + 4 * (self.count + 1)
+        view = memoryview(self.buffer)
+        self.ids = view[ids_start:offsets_start].cast('I')
+        self.offsets = view[offsets_start:self.data_start].cast('I')
+
+    @classmethod
+    def build(cls, path, version):
+        """Write index of current catalog to path atomically."""
+        records = sorted(
+            (name.casefold().encode(), pk, name.encode(), unit.encode())
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator())
+        ids = array('I', (record[1] for record in records))
+        offsets = array('I', [0])
+        data = bytearray()
+        for key, _, name, unit in records:
+            data += cls.SEPARATOR.join((key, name, unit))
+            offsets.append(len(data))
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(cls.HEADER.pack(
+                cls.MAGIC, version.encode(), len(records)))
+            file.write(ids.tobytes())
+            file.write(offsets.tobytes())
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def get_record(self, position):
+        start = self.data_start + self.offsets[position]
+        end = self.data_start + self.offsets[position + 1]
+        return self.buffer[start:end].split(self.SEPARATOR)
+
+    def get_key(self, position):
+        start = self.data_start + self.offsets[position]
+        end = self.buffer.find(self.SEPARATOR, start)
+        return self.buffer[start:end]
+
+    def search(self, prefix, limit):
+        """Ingredients which names start with prefix, case insensitive."""
+        prefix = prefix.casefold().encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        result = []
+        for position in range(low, min(low + limit, self.count)):
+            key, name, unit = self.get_record(position)
+            if not key.startswith(prefix):
+                break
+            result.append({
+                'id': self.ids[position],
+                'name': name.decode(),
+                'measurement_unit': unit.decode(),
+            })
+        return result
+
+
+_index = None
+
+
+def get_ingredient_index():
+    """Return index for current ingredients version, rebuilding it if
+    catalog was changed. Only one worker rebuilds at a time."""
+    global _index
+    version = get_version(INGREDIENTS_VERSION)
+    path = os.path.join(settings.SHARED_STATE_DIR, 'ingredients.idx')
+    if (_index is not None and _index.path == path
+            and _index.version == version):
+        return _index
+    os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            index = IngredientPrefixIndex(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            index = None
+        if index is None or index.version != version:
+            IngredientPrefixIndex.build(path, version)
+            index = IngredientPrefixIndex(path)
+    _index = index
+    return _index
+
+
+class RecipeIngredientIndex:
+    """
+    Inverted index of recipes by their ingredients.
+
+    File layout: header (magic, build time, numbers of ingredients,
+    postings and recipes), then uint32 arrays: sorted ingredient ids,
+    offsets of their postings, postings (sorted ids of recipes with the
+    ingredient), sorted recipe ids and numbers of their ingredients.
+    The file is memory-mapped like IngredientPrefixIndex. Recipes
+    modified after build are read from database on every query, so the
+    index is never stale and is rebuilt only when there are many of them.
+    """
+    MAGIC = b'FGR1'
+    HEADER = struct.Struct('<4sdIII')
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (stat.st_ino, stat.st_mtime_ns)
+        (magic, self.built_at, ingredients, postings,
+         recipes) = self.HEADER.unpack_from(self.buffer)
+        if magic != self.MAGIC:
+            raise ValueError(f'{path} is not a recipe index.')
+        view = memoryview(self.buffer)
+        arrays = []
+        start = self.HEADER.size
+        for length in (ingredients, ingredients + 1, postings, recipes,
+                       recipes):
+            arrays.append(view[start:start + 4 * length].cast('I'))
+            start += 4 * length
+        (self.ingredient_ids, self.offsets, self.postings, self.recipe_ids,
+         self.sizes) = arrays
+
+    @classmethod
+    def build(cls, path):
+        """Write index of all recipes to path atomically."""
+        built_at = time.time()
+        ingredient_ids = array('I')
+        offsets = array('I')
+        postings = array('I')
+        sizes = Counter()
+        for ingredient_id, recipe_id in RecipeIngredient.objects.order_by(
+                'ingredient_id', 'recipe_id').values_list(
+                'ingredient_id', 'recipe_id').iterator():
+            if not ingredient_ids or ingredient_ids[-1] != ingredient_id:
+                ingredient_ids.append(ingredient_id)
+                offsets.append(len(postings))
+            postings.append(recipe_id)
+            sizes[recipe_id] += 1
+        offsets.append(len(postings))
+        recipe_ids = array('I', sorted(sizes))
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(cls.HEADER.pack(
+                cls.MAGIC, built_at, len(ingredient_ids), len(postings),
+                len(recipe_ids)))
+            for data in (ingredient_ids, offsets, postings, recipe_ids,
+                         array('I', (sizes[pk] for pk in recipe_ids))):
+                file.write(data.tobytes())
+        os.replace(tmp_path, path)
+
+    def is_outdated(self):
+        """More than RECIPE_INDEX_MAX_CHANGES recipes were modified after
+        build. Index younger than RECIPE_INDEX_MARGIN is never outdated,
+        changes inside the margin are loaded by every rebuilt index."""
+        if time.time() - self.built_at < settings.RECIPE_INDEX_MARGIN:
+            return False
+        limit = settings.RECIPE_INDEX_MAX_CHANGES
+        since = datetime.fromtimestamp(self.built_at, timezone.utc)
+        changed = Recipe.objects.filter(modified__gte=since).order_by()
+        return len(changed.values_list('id', flat=True)[:limit + 1]) > limit
+
+    def get_changes(self):
+        """{recipe id: ingredient ids} of recipes modified since build,
+        with a margin for transactions committed later."""
+        since = datetime.fromtimestamp(
+            self.built_at - settings.RECIPE_INDEX_MARGIN, timezone.utc)
+        changes = defaultdict(set)
+        for recipe_id, ingredient_id in Recipe.objects.filter(
+                modified__gte=since).order_by().values_list(
+                'id', 'recipe_for_ingredient__ingredient_id'):
+            changes[recipe_id].add(ingredient_id)
+        return changes
+
+    def get_recipes(self, ingredient_id):
+        position = bisect_left(self.ingredient_ids, ingredient_id)
+        if (position == len(self.ingredient_ids)
+                or self.ingredient_ids[position] != ingredient_id):
+            return ()
+        return self.postings[
+            self.offsets[position]:self.offsets[position + 1]]
+
+    def get_size(self, recipe_id):
+        return self.sizes[bisect_left(self.recipe_ids, recipe_id)]
+
+    def with_all(self, ingredient_ids, changes):
+        """Ids of recipes having all of ingredients."""
+        postings = sorted(map(self.get_recipes, ingredient_ids), key=len)
+        found = set(postings[0]).intersection(*postings[1:])
+        found.difference_update(changes)
+        found.update(pk for pk, ingredients in changes.items()
+                     if ingredients.issuperset(ingredient_ids))
+        return found
+
+    def with_any(self, ingredient_ids, changes):
+        """Ids of recipes having any of ingredients."""
+        found = set()
+        for pk in ingredient_ids:
+            found.update(self.get_recipes(pk))
+        found.difference_update(changes)
+        found.update(pk for pk, ingredients in changes.items()
+                     if not ingredients.isdisjoint(ingredient_ids))
+        return found
+
+    def rank(self, pantry, changes, limit, candidates=None, excluded=()):
+        """Ids of recipes using most of pantry ingredients, the ones
+        missing fewer other ingredients first."""
+        used = Counter()
+        for pk in pantry:
+            used.update(self.get_recipes(pk))
+        sizes = {}
+        for pk, ingredients in changes.items():
+            used.pop(pk, None)
+            if not ingredients.isdisjoint(pantry):
+                used[pk] = len(ingredients & pantry)
+                sizes[pk] = len(ingredients)
+        return heapq.nsmallest(limit, (
+            pk for pk in used
+            if (candidates is None or pk in candidates)
+            and pk not in excluded
+        ), key=lambda pk: (
+            -used[pk],
+            (sizes[pk] if pk in sizes else self.get_size(pk)) - used[pk],
+            -pk))
+
+
+_recipe_index = None
+
+
+def get_recipe_index(stale=None):
+    """Return recipe index, loading it again if other worker rebuilt it.
+    Index is rebuilt if it is missing or is the stale one."""
+    global _recipe_index
+    path = os.path.join(settings.SHARED_STATE_DIR, 'recipes.idx')
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        stat = None
+    if (stale is None and stat is not None and _recipe_index is not None
+            and _recipe_index.path == path
+            and _recipe_index.stamp == (stat.st_ino, stat.st_mtime_ns)):
+        return _recipe_index
+    os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            index = RecipeIngredientIndex(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            index = None
+        if index is None or (stale is not None
+                             and index.stamp == stale.stamp):
+            RecipeIngredientIndex.build(path)
+            index = RecipeIngredientIndex(path)
+    _recipe_index = index
+    return _recipe_index
+
+
+def filter_by_ingredients(queryset, include=(), exclude=(), pantry=()):
+    """
+    Recipes having all of include and none of exclude ingredients.
+    With pantry, only PANTRY_SEARCH_LIMIT recipes using most of pantry
+    ingredients are left, ordered by that.
+    """
+    if not include and not pantry:
+        return filter_in_database(queryset, include, exclude)
+    include, exclude, pantry = map(frozenset, (include, exclude, pantry))
+    index = get_recipe_index()
+    if index.is_outdated():
+        index = get_recipe_index(stale=index)
+    changes = index.get_changes()
+    excluded = index.with_any(exclude, changes)
+    candidates = None
+    if include:
+        candidates = index.with_all(include, changes) - excluded
+    if pantry:
+        ranked = index.rank(pantry, changes, settings.PANTRY_SEARCH_LIMIT,
+                            candidates, excluded)
+        if not ranked:
+            return queryset.none()
+        return queryset.filter(id__in=ranked).order_by(Case(
+            *(When(id=pk, then=position)
+              for position, pk in enumerate(ranked)),
+            output_field=IntegerField()))
+    if len(candidates) > settings.INGREDIENT_FILTER_LIMIT:
+        # too long for IN list, database finds the same recipes
+        return filter_in_database(queryset, include, exclude)
+    return queryset.filter(id__in=candidates)
+
+
+def filter_in_database(queryset, include, exclude):
+    """Same as filter_by_ingredients without pantry, with subqueries
+    by ingredient ids instead of lists of recipe ids."""
+    if include:
+        queryset = queryset.filter(id__in=RecipeIngredient.objects.filter(
+            ingredient_id__in=include).values('recipe_id').annotate(
+            found=Count('ingredient_id', distinct=True)).filter(
+            found=len(include)).values('recipe_id'))
+    if exclude:
+        queryset = queryset.exclude(
+            recipe_for_ingredient__ingredient__in=exclude)
+    return queryset
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пометка изображений, которые обрабатываются дольше '
+        'IMAGE_PROCESSING_TIMEOUT секунд, как ошибочных. Задачи пула '
+        'хранятся в памяти и пропадают при перезапуске процесса, '
+        'команду стоит запускать по расписанию.'
+    )
+
+    def handle(self, **options):
+        now = timezone.now()
+        failed = Recipe.objects.filter(
+            image_status=Recipe.IMAGE_PENDING,
+            modified__lt=now - timedelta(
+                seconds=settings.IMAGE_PROCESSING_TIMEOUT)
+        ).update(image_status=Recipe.IMAGE_FAILED, modified=now)
+        self.stdout.write(f'Помечено как ошибочные: {failed}')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import generate_variants, has_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание уменьшенных копий изображений рецептов, у которых их '
+        'ещё нет: созданных до появления копий или импортированных без '
+        '--variants. Пока копий нет, API отдаёт image_variants: null.'
+    )
+
+    def handle(self, **options):
+        recipes = Recipe.objects.filter(
+            image_variants_ready=False,
+            image_status=Recipe.IMAGE_READY).exclude(image='')
+        names = list(recipes.order_by('image').values_list(
+            'image', flat=True).distinct())
+        ready = failed = 0
+        for name in names:
+            if has_variants(name) or generate_variants(name):
+                ready += recipes.filter(image=name).update(
+                    image_variants_ready=True, modified=timezone.now())
+            else:
+                failed += 1
+        self.stdout.write(
+            f'Копии созданы для рецептов: {ready}, '
+            f'не удалось прочитать изображений: {failed}')
@@ -0,0 +1,55 @@
+import time
+import xml.etree.ElementTree as ET
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foodgram_api.versions import bump_version
+from recipes.importers import (batched, read_csv, read_fixture_xml,
+                               read_json, read_jsonl, read_rows)
+from recipes.models import Ingredient
+from recipes.utils import INGREDIENTS_VERSION
+
+READERS = {
+    'xml': read_fixture_xml,
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка ингредиентов из XML фикстуры, CSV, JSONL или JSON с '
+        'полями name и measurement_unit. Уже существующие ингредиенты '
+        'пропускаются, так что файл можно загружать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=READERS, dest='file_format')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, path, file_format, batch_size, **options):
+        started = time.monotonic()
+        count_before = Ingredient.objects.count()
+        total = 0
+        try:
+            rows = read_rows(path, READERS, file_format)
+            for batch in batched(rows, batch_size):
+                ingredients = [Ingredient(
+                    name=row['name'].strip(),
+                    measurement_unit=row['measurement_unit'].strip()
+                ) for row in batch]
+                with transaction.atomic():
+                    Ingredient.objects.bulk_create(
+                        ingredients, ignore_conflicts=True)
+                total += len(ingredients)
+        except (OSError, KeyError, ValueError, ET.ParseError) as error:
+            raise CommandError(f'{error!r}')
+        created = Ingredient.objects.count() - count_before
+        if created:
+            bump_version(INGREDIENTS_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {total}, добавлено {created} ингредиентов за '
+            f'{time.monotonic() - started:.1f} с.'))
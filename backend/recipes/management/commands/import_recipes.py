@@ -0,0 +1,158 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from foodgram_api.counters import change_counters
+from recipes import timeline
+from recipes.images import generate_variants
+from recipes.importers import (READERS, batched, can_copy, copy_rows,
+                               read_rows)
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+class RowError(ValueError):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Импорт рецептов из JSONL или CSV. Поля: author (email), name, '
+        'text, cooking_time, image (путь в MEDIA_ROOT), tags (список '
+        'slug, в CSV через запятую), ingredients (список объектов name, '
+        'measurement_unit, amount, в CSV в виде JSON).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=READERS, dest='file_format')
+        parser.add_argument('--author',
+                            help='email автора для строк без author')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--variants', action='store_true',
+                            help='создать уменьшенные копии изображений '
+                                 '(иначе их создаёт generate_image_variants)')
+
+    def handle(self, path, file_format, author, batch_size, variants,
+               **options):
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')}
+        self.authors = {}
+        self.default_author = author
+        imported = skipped = 0
+        started = time.monotonic()
+        try:
+            rows = read_rows(path, READERS, file_format)
+            for number, batch in enumerate(batched(rows, batch_size)):
+                recipes = []
+                for offset, row in enumerate(batch, number * batch_size + 1):
+                    try:
+                        recipes.append(self.parse_row(row))
+                    except (RowError, KeyError, TypeError,
+                            ValueError) as error:
+                        skipped += 1
+                        self.stderr.write(f'Строка {offset}: {error}')
+                with transaction.atomic():
+                    self.insert(recipes)
+                if variants:
+                    Recipe.objects.filter(pk__in=[
+                        recipe.id for recipe, _, _ in recipes
+                        if generate_variants(recipe.image.name)
+                    ]).update(image_variants_ready=True)
+                imported += len(recipes)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Импортировано {imported}, пропущено {skipped}, '
+                    f'{imported / max(elapsed, 0.001):.0f} рецептов/с')
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {imported} рецептов за '
+            f'{time.monotonic() - started:.1f} с, пропущено {skipped}.'))
+
+    def get_author_id(self, email):
+        email = email or self.default_author
+        if not email:
+            raise RowError('Не указан автор.')
+        if email not in self.authors:
+            self.authors[email] = User.objects.filter(
+                email=email).values_list('id', flat=True).first()
+        if self.authors[email] is None:
+            raise RowError(f'Нет пользователя {email}.')
+        return self.authors[email]
+
+    def parse_row(self, row):
+        """Recipe with ids of its tags and (ingredient id, amount) pairs,
+        all resolved from in-memory maps."""
+        tags = row.get('tags') or []
+        if isinstance(tags, str):
+            tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        ingredients = row.get('ingredients') or []
+        if isinstance(ingredients, str):
+            ingredients = json.loads(ingredients)
+        if not ingredients:
+            raise RowError('Нет ингредиентов.')
+        tag_ids = set()
+        for slug in tags:
+            if slug not in self.tags:
+                raise RowError(f'Нет тега {slug}.')
+            tag_ids.add(self.tags[slug])
+        amounts = {}
+        for ingredient in ingredients:
+            key = (ingredient['name'], ingredient['measurement_unit'])
+            if key not in self.ingredients:
+                raise RowError(f'Нет ингредиента {key}.')
+            amount = int(ingredient['amount'])
+            if amount < 1:
+                raise RowError('Количество ингредиента должно быть больше 0.')
+            pk = self.ingredients[key]
+            amounts[pk] = amounts.get(pk, 0) + amount
+        cooking_time = int(row['cooking_time'])
+        if cooking_time < 1:
+            raise RowError('Время приготовления должно быть больше 0.')
+        now = timezone.now()
+        recipe = Recipe(
+            author_id=self.get_author_id(row.get('author')),
+            pub_date=now,
+            modified=now,
+            name=row['name'],
+            text=row['text'],
+            cooking_time=cooking_time,
+            image=row['image'],
+        )
+        return recipe, tag_ids, amounts
+
+    def insert(self, recipes):
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.bulk_create(recipe for recipe, _, _ in recipes)
+        else:
+            # primary keys are not returned by bulk insert here
+            for recipe, _, _ in recipes:
+                recipe.save_base(raw=True, force_insert=True)
+        change_counters(User, 'recipes_count',
+                        [recipe.author_id for recipe, _, _ in recipes])
+        timeline.fan_out(recipe for recipe, _, _ in recipes)
+        ingredient_rows = [
+            (recipe.id, pk, amount)
+            for recipe, _, amounts in recipes
+            for pk, amount in amounts.items()]
+        tag_rows = [(recipe.id, pk)
+                    for recipe, tag_ids, _ in recipes for pk in tag_ids]
+        through = Recipe.tags.through
+        if can_copy():
+            copy_rows(RecipeIngredient,
+                      ('recipe', 'ingredient', 'amount'), ingredient_rows)
+            copy_rows(through, ('recipe', 'tag'), tag_rows)
+            return
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=pk,
+                             amount=amount)
+            for recipe_id, pk, amount in ingredient_rows)
+        through.objects.bulk_create(
+            through(recipe_id=recipe_id, tag_id=pk)
+            for recipe_id, pk in tag_rows)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodgram_api.counters import recount
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+# model, counter field, related model, its field referencing model
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного, покупок, рецептов и подписчиков.'
+
+    def handle(self, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            with transaction.atomic():
+                fixed = recount(model, field, related_model, related_field)
+            self.stdout.write(
+                f'{model._meta.label}.{field}: исправлено {fixed}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_auto_20211122_1631'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия списка ингредиентов'),
+        ),
+    ]
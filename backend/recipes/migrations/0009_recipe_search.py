@@ -0,0 +1,55 @@
+from django.db import migrations
+
+INDEX = 'recipes_recipe_search_idx'
+FTS = 'recipes_recipe_fts'
+
+STATEMENTS = {
+    'postgresql': (
+        (f'CREATE INDEX CONCURRENTLY {INDEX} ON recipes_recipe USING GIN ('
+         f"(to_tsvector('russian', coalesce(name, '') "
+         f"|| ' ' || coalesce(text, ''))))",),
+        (f'DROP INDEX CONCURRENTLY {INDEX}',),
+    ),
+    'sqlite': (
+        (f'CREATE VIRTUAL TABLE {FTS} USING fts5(name, text, '
+         f"content='recipes_recipe', content_rowid='id')",
+         f"INSERT INTO {FTS}({FTS}) VALUES ('rebuild')",
+         f'CREATE TRIGGER {FTS}_insert AFTER INSERT ON recipes_recipe BEGIN '
+         f'INSERT INTO {FTS}(rowid, name, text) '
+         f'VALUES (new.id, new.name, new.text); END',
+         f'CREATE TRIGGER {FTS}_delete AFTER DELETE ON recipes_recipe BEGIN '
+         f'INSERT INTO {FTS}({FTS}, rowid, name, text) '
+         f"VALUES ('delete', old.id, old.name, old.text); END",
+         f'CREATE TRIGGER {FTS}_update AFTER UPDATE OF name, text '
+         f'ON recipes_recipe BEGIN '
+         f'INSERT INTO {FTS}({FTS}, rowid, name, text) '
+         f"VALUES ('delete', old.id, old.name, old.text); "
+         f'INSERT INTO {FTS}(rowid, name, text) '
+         f'VALUES (new.id, new.name, new.text); END'),
+        (f'DROP TRIGGER {FTS}_insert',
+         f'DROP TRIGGER {FTS}_delete',
+         f'DROP TRIGGER {FTS}_update',
+         f'DROP TABLE {FTS}'),
+    ),
+}
+
+
+def run(direction):
+    def execute(apps, schema_editor):
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        for statement in statements[direction] if statements else ():
+            schema_editor.execute(statement)
+    return execute
+
+
+class Migration(migrations.Migration):
+    # index of large table is built without locking writes
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0008_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(0), run(1)),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.24 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+FTS = 'recipes_recipe_fts'
+
+# SQLite drops triggers of 0009_recipe_search when AlterField remakes
+# recipes_recipe table, they are created again after it
+TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS {FTS}_insert AFTER INSERT '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS}_delete AFTER DELETE '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS}({FTS}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {FTS}_update AFTER UPDATE OF name, text '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS}({FTS}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {FTS}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f"INSERT INTO {FTS}({FTS}) VALUES ('rebuild')",
+)
+
+
+def restore_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AlterField(
+            model_name='recipe',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.24 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+FTS = 'recipes_recipe_fts'
+
+# SQLite drops triggers of 0009_recipe_search when AddField remakes
+# recipes_recipe table, they are created again after it
+TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS {FTS}_insert AFTER INSERT '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS}_delete AFTER DELETE '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS}({FTS}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {FTS}_update AFTER UPDATE OF name, text '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS}({FTS}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {FTS}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f"INSERT INTO {FTS}({FTS}) VALUES ('rebuild')",
+)
+
+
+def restore_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_modified_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False, verbose_name='Копии изображения созданы'),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
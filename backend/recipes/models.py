@@ -2,8 +2,10 @@ from colorfield.fields import ColorField
 
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
 
-from users.models import User
+from foodgram_api.counters import CountersMixin
+from users.models import User, is_subscribed_expression
 
 
 class Tag(models.Model):
@@ -59,7 +61,71 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_flags(self, user):
+        """Annotate is_favorited and is_in_shopping_cart for given user."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+
+    @staticmethod
+    def get_display_lookups(user):
+        """Prefetches of author, tags and ingredients for
+        RecipeShowSerializer. Tags and ingredients are put to
+        display_tags and display_ingredients lists."""
+        return {
+            'author': Prefetch('author', queryset=User.objects.annotate(
+                is_subscribed=is_subscribed_expression(user))),
+            'tags': Prefetch('tags', to_attr='display_tags'),
+            'ingredients': Prefetch(
+                'recipe_for_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient').order_by('id'),
+                to_attr='display_ingredients'),
+        }
+
+    def for_display(self, user):
+        """Preload everything RecipeShowSerializer needs for given user:
+        author, tags, ingredients and favorite/cart/subscribe flags."""
+        return self.with_flags(user).prefetch_related(
+            *self.get_display_lookups(user).values())
+
+    def values_for_display(self, user):
+        """Rows of fields and flags RecipeListSerializer needs, its
+        authors, tags and ingredients are loaded by serializer."""
+        return self.with_flags(user).values(
+            'id', 'author_id', 'is_favorited', 'is_in_shopping_cart', 'name',
+            'image', 'image_status', 'image_variants_ready', 'text',
+            'cooking_time', 'pub_date')
+
+    def get_state(self, user, pk):
+        """Modification date and user's flags of recipe in one query,
+        enough to validate cached representation. None if not found."""
+        return self.with_flags(user).annotate(
+            is_subscribed=is_subscribed_expression(user, 'author')
+        ).filter(pk=pk).values_list(
+            'modified', 'is_favorited', 'is_in_shopping_cart',
+            'is_subscribed'
+        ).first()
+
+
+class Recipe(CountersMixin, models.Model):
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PENDING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -75,6 +141,16 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Изображение',
         help_text='Выберите изображение')
+    image_status = models.CharField(
+        'Состояние изображения',
+        max_length=10,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_READY
+    )
+    image_variants_ready = models.BooleanField(
+        'Копии изображения созданы',
+        default=False
+    )
     text = models.TextField(
         verbose_name='Описание',
         help_text='Введите краткое описание'
@@ -102,11 +178,38 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    ingredients_version = models.PositiveIntegerField(
+        'Версия списка ингредиентов',
+        default=0,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавили в избранное',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавили в список покупок',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -199,3 +302,37 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} add {self.recipe} to list'
+
+
+class TimelineEntry(models.Model):
+    """Recipe of followed author in user's feed. pub_date is copied
+    from recipe, so feed is read by index on this table only."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique-timeline-entry'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-id'),
+                         name='timeline_user_pub_date_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} in feed of {self.user}'
@@ -0,0 +1,59 @@
+"""
+Full-text search of recipes by name and text.
+
+PostgreSQL matches GIN-indexed tsvector of both fields and ranks with
+ts_rank, SQLite (local and test setups) uses FTS5 table kept in sync by
+triggers and ranks with its bm25 rank. Index, table and triggers are
+created by migration 0009_recipe_search. Other databases fall back to
+icontains without ranking.
+
+SQLite drops triggers when a migration remakes recipes_recipe table
+(e.g. on AlterField), such migrations must create them again (see
+0010_recipe_modified_index).
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+FTS_TABLE = 'recipes_recipe_fts'
+# must be the same as indexed expression in migration
+VECTOR = ("to_tsvector('russian', coalesce(recipes_recipe.name, '') "
+          "|| ' ' || coalesce(recipes_recipe.text, ''))")
+TSQUERY = "plainto_tsquery('russian', %s)"
+
+
+def get_words(query):
+    return re.findall(r'\w+', query)
+
+
+def search(queryset, query):
+    """Recipes matching all words of query, annotated with search_rank
+    (bigger is better) and ordered by it, newest first on ties."""
+    words = get_words(query)
+    if not words:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        queryset = queryset.extra(
+            select={'search_rank': f'ts_rank({VECTOR}, {TSQUERY})'},
+            select_params=(query,),
+            where=(f'{VECTOR} @@ {TSQUERY}',),
+            params=(query,))
+    elif vendor == 'sqlite':
+        # every word is quoted, so FTS5 syntax in query is never parsed
+        match = ' '.join('"{}"'.format(word) for word in words)
+        queryset = queryset.extra(
+            select={'search_rank': (
+                f'SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'AND rowid = recipes_recipe.id')},
+            select_params=(match,),
+            where=(f'recipes_recipe.id IN (SELECT rowid FROM {FTS_TABLE} '
+                   f'WHERE {FTS_TABLE} MATCH %s)',),
+            params=(match,))
+    else:
+        condition = Q()
+        for word in words:
+            condition &= Q(name__icontains=word) | Q(text__icontains=word)
+        return queryset.filter(condition)
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
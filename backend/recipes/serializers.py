@@ -1,10 +1,19 @@
+from operator import attrgetter
+
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from django.db import transaction
+from django.db.models import F, prefetch_related_objects
+from django.utils import timezone
+
+from users.models import User, is_subscribed_expression
 from users.serializers import UserDetailSerializer
-from .commons import ShowRecipeSerializerMixin
+from .commons import Base64ImageDataField, ImageVariantsField
+from .images import get_image_variants
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
+from .tasks import process_image, schedule
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -45,7 +54,7 @@ class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
     """
     For representation Ingredient inside recipes.
     """
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -56,9 +65,8 @@ class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
 class RecipeCreateSerializer(serializers.ModelSerializer):
     author = UserDetailSerializer(read_only=True)
     ingredients = AddIngredientToRecipeSerializer(many=True)
-    image = Base64ImageField(required=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    image = Base64ImageDataField(required=True, write_only=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -67,6 +75,20 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                   'ingredients', 'name',
                   'image', 'text', 'cooking_time')
 
+    @staticmethod
+    def get_objects(model, ids, name):
+        """Map of objects by ids, fetched in one query."""
+        objects = model.objects.in_bulk(set(ids))
+        missing = sorted(set(ids) - set(objects))
+        if missing:
+            raise serializers.ValidationError(
+                f'{name} с id {missing} не существует.')
+        return objects
+
+    def validate_tags(self, tags):
+        objects = self.get_objects(Tag, tags, 'Тега')
+        return [objects[pk] for pk in dict.fromkeys(tags)]
+
     def validate_ingredients(self, ingredients):
         uniq_ingredients = {}
         for ingredient in ingredients:
@@ -75,8 +97,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     'Количество ингредиента должно быть больше 0.')
             uniq_ingredients[ingredient['id']] = uniq_ingredients.get(
                 ingredient['id'], 0) + ingredient['amount']
+        objects = self.get_objects(Ingredient, uniq_ingredients, 'Ингредиента')
         validated_data = [
-            {'id': key,
+            {'id': objects[key],
              'amount': value} for key, value in uniq_ingredients.items()]
         return validated_data
 
@@ -86,34 +109,105 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 'Время приготовления должно быть больше 0.')
         return value
 
+    def set_display_data(self, recipe, tags=None, rows=None):
+        """Put everything RecipeShowSerializer needs into recipe, so
+        response is built without queries where data is known already.
+        Tags and rows are ordered as Recipe.objects.for_display() does."""
+        user = self.context.get('request').user
+        if recipe.author_id == user.id:
+            # users can't subscribe to themselves
+            user.is_subscribed = False
+            recipe.author = user
+        lookups = Recipe.objects.get_display_lookups(user)
+        del lookups['author']
+        if tags is not None:
+            recipe.display_tags = sorted(tags, key=attrgetter('id'))
+            del lookups['tags']
+        if rows is not None:
+            # rows created by bulk_create may have no ids, they are last
+            recipe.display_ingredients = sorted(
+                rows, key=lambda row: (row.pk is None, row.pk or 0))
+            del lookups['ingredients']
+        prefetch_related_objects([recipe], *lookups.values())
+
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        image = validated_data.pop('image')
         author = self.context.get('request').user
-        recipe = Recipe.objects.create(author=author, **validated_data)
-        obj = [
-            RecipeIngredient(
-                ingredient=ing['id'],
-                recipe=recipe,
-                amount=ing['amount']) for ing in ingredients]
-        RecipeIngredient.objects.bulk_create(obj)
-        recipe.tags.set(tags)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=author, image_status=Recipe.IMAGE_PENDING,
+                **validated_data)
+            rows = [
+                RecipeIngredient(
+                    ingredient=ing['id'],
+                    recipe=recipe,
+                    amount=ing['amount']) for ing in ingredients]
+            RecipeIngredient.objects.bulk_create(rows)
+            # new recipe has no tags, so set() with its checks isn't needed
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags)
+            schedule(recipe, process_image, image)
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+        self.set_display_data(recipe, tags, rows)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Insert, update and delete only rows which differ from
+        ingredients. Returns resulting rows and whether anything was
+        changed."""
+        current = {row.ingredient_id: row
+                   for row in recipe.recipe_for_ingredient.all()}
+        amounts = {ing['id'].id: ing['amount'] for ing in ingredients}
+        to_create, to_update, rows = [], [], []
+        for ingredient in ingredients:
+            row = current.get(ingredient['id'].id)
+            if row is None:
+                row = RecipeIngredient(recipe=recipe)
+                to_create.append(row)
+            elif row.amount != ingredient['amount']:
+                to_update.append(row)
+            row.ingredient = ingredient['id']
+            row.amount = ingredient['amount']
+            rows.append(row)
+        to_delete = [row.pk for ingredient_id, row in current.items()
+                     if ingredient_id not in amounts]
+        if to_delete:
+            # one DELETE without per-row signals, version is bumped below
+            RecipeIngredient.objects.filter(pk__in=to_delete)._raw_delete(
+                RecipeIngredient.objects.db)
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        return rows, bool(to_delete or to_update or to_create)
+
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
-        if tags is not None:
-            instance.tags.set(tags)
-
         ingredients = validated_data.pop('ingredients', None)
-        instance.recipe_for_ingredient.all().delete()
-        obj = [
-            RecipeIngredient(
-                ingredient=ing['id'],
-                recipe=instance,
-                amount=ing['amount']) for ing in ingredients]
-        RecipeIngredient.objects.bulk_create(obj)
-        return super().update(instance, validated_data)
+        image = validated_data.pop('image', None)
+        if image is not None:
+            validated_data['image_status'] = Recipe.IMAGE_PENDING
+        with transaction.atomic():
+            for field, value in validated_data.items():
+                setattr(instance, field, value)
+            # only sent fields are written, so image set by processing
+            # pool meanwhile and counters aren't overwritten
+            instance.save(update_fields=(*validated_data, 'modified'))
+            if tags is not None:
+                instance.tags.set(tags)
+            rows = None
+            if ingredients is not None:
+                rows, changed = self.update_ingredients(instance, ingredients)
+                if changed:
+                    Recipe.objects.filter(pk=instance.pk).update(
+                        ingredients_version=F('ingredients_version') + 1,
+                        modified=timezone.now())
+            if image is not None:
+                schedule(instance, process_image, image)
+        self.set_display_data(instance, tags, rows)
+        return instance
 
     def to_representation(self, instance):
         return RecipeShowSerializer(
@@ -123,11 +217,14 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 
 class RecipeShowSerializer(serializers.ModelSerializer):
-    tags = TagSerializer(many=True)
+    """Recipe from Recipe.objects.for_display() or with
+    set_display_data() applied."""
+    tags = TagSerializer(many=True, source='display_tags')
     author = UserDetailSerializer(read_only=True)
     image = Base64ImageField(required=True)
+    image_variants = ImageVariantsField()
     ingredients = IngredientInRecipeSerializer(
-        source='recipe_for_ingredient', many=True)
+        source='display_ingredients', many=True)
     is_in_shopping_cart = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
 
@@ -135,47 +232,78 @@ class RecipeShowSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author',
                   'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image',
+                  'image_variants', 'image_status', 'text', 'cooking_time')
 
-    def __get_is_any(self, obj, model):
+    def __get_is_any(self, obj, model, annotation):
+        value = getattr(obj, annotation, None)
+        if value is not None:
+            return value
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return model.objects.filter(recipe=obj, user=user).exists()
 
     def get_is_favorited(self, obj):
-        return self.__get_is_any(obj, Favorite)
+        return self.__get_is_any(obj, Favorite, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.__get_is_any(obj, ShoppingCart)
+        return self.__get_is_any(obj, ShoppingCart, 'is_in_shopping_cart')
 
 
-class FavoriteSerializer(ShowRecipeSerializerMixin,
-                         serializers.ModelSerializer):
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже находится в избранном.'
-            )
-        ]
-
-
-class ShoppingCartSerializer(ShowRecipeSerializerMixin,
-                             serializers.ModelSerializer):
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже находится в списке покупок.'
-            )
-        ]
+class RecipeListSerializer(serializers.BaseSerializer):
+    """
+    Read-only RecipeShowSerializer for lists of recipes. Builds the same
+    JSON from rows of Recipe.objects.values_for_display() and one query
+    for authors, tags and ingredients of all rows each, without model
+    instances and nested serializers.
+    """
+    AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name',
+                     'is_subscribed')
+
+    def to_representation(self, rows):
+        request = self.context.get('request')
+        ids = [row['id'] for row in rows]
+        authors = {author['id']: author for author in User.objects.filter(
+            id__in={row['author_id'] for row in rows}
+        ).annotate(
+            is_subscribed=is_subscribed_expression(request.user)
+        ).values(*self.AUTHOR_FIELDS)}
+        tags = {pk: [] for pk in ids}
+        for recipe_id, *tag in Recipe.tags.through.objects.filter(
+                recipe_id__in=ids).order_by('tag_id').values_list(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__color',
+                'tag__slug'):
+            tags[recipe_id].append(dict(zip(TagSerializer.Meta.fields, tag)))
+        ingredients = {pk: [] for pk in ids}
+        for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+                recipe_id__in=ids).order_by('id').values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'):
+            ingredients[recipe_id].append(dict(zip(
+                IngredientInRecipeSerializer.Meta.fields, ingredient)))
+        storage = Recipe._meta.get_field('image').storage
+        result = []
+        for row in rows:
+            image = image_variants = None
+            if row['image']:
+                image = storage.url(row['image'])
+                if request is not None:
+                    image = request.build_absolute_uri(image)
+            if row['image'] and row['image_variants_ready']:
+                image_variants = get_image_variants(row['image'], request)
+            result.append({
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': authors[row['author_id']],
+                'ingredients': ingredients[row['id']],
+                'is_favorited': row['is_favorited'],
+                'is_in_shopping_cart': row['is_in_shopping_cart'],
+                'name': row['name'],
+                'image': image,
+                'image_variants': image_variants,
+                'image_status': row['image_status'],
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+            })
+        return result
@@ -0,0 +1,169 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from foodgram_api.counters import change_counter
+from foodgram_api.versions import bump_version
+from users.models import Subscription, User
+from . import timeline
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Tag)
+from .tasks import create_variants, schedule
+from .utils import (INGREDIENTS_VERSION, TAGS_VERSION,
+                    shopping_list_cache_key)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def bump_ingredients_version(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        ingredients_version=F('ingredients_version') + 1,
+        modified=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipes_on_tags_change(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    if action in ('post_add', 'post_remove'):
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    elif action == 'pre_clear':
+        recipes = Recipe.objects.filter(tags=instance)
+    else:
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    recipes.update(modified=timezone.now())
+
+
+# fields of tags, ingredients and authors shown inside recipes
+DISPLAYED_FIELDS = {
+    Tag: ('name', 'color', 'slug'),
+    Ingredient: ('name', 'measurement_unit'),
+    User: ('email', 'username', 'first_name', 'last_name'),
+}
+
+
+def touch_related_recipes(sender, instance):
+    lookup = {Tag: 'tags', Ingredient: 'ingredients', User: 'author'}[sender]
+    changes = {'modified': timezone.now()}
+    if sender is Ingredient:
+        # names and units are part of cached shopping lists
+        changes['ingredients_version'] = F('ingredients_version') + 1
+    Recipe.objects.filter(**{lookup: instance}).update(**changes)
+
+
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Ingredient)
+@receiver(pre_save, sender=User)
+def check_displayed_fields(sender, instance, raw=False, update_fields=None,
+                           **kwargs):
+    """Compare displayed fields with saved ones, so only their changes
+    modify recipes. Other saves (password, last_login) touch nothing."""
+    instance._displayed_fields_changed = False
+    fields = DISPLAYED_FIELDS[sender]
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    if raw or instance.pk is None or not fields:
+        return
+    saved = sender.objects.filter(pk=instance.pk).values_list(
+        *fields).first()
+    instance._displayed_fields_changed = saved is not None and saved != tuple(
+        getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=User)
+def touch_recipes_on_change(sender, instance, **kwargs):
+    if getattr(instance, '_displayed_fields_changed', False):
+        touch_related_recipes(sender, instance)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_delete(sender, instance, **kwargs):
+    touch_related_recipes(sender, instance)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def drop_shopping_list(sender, instance, **kwargs):
+    caches['shopping_lists'].delete(shopping_list_cache_key(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_catalog_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(INGREDIENTS_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS_VERSION))
+
+
+@receiver(pre_save, sender=Recipe)
+def check_image_change(sender, instance, raw=False, update_fields=None,
+                       **kwargs):
+    """Variants of image replaced outside of the pool (e.g. in admin)
+    are made again."""
+    if (raw or instance.pk is None or not instance.image_variants_ready
+            or update_fields is not None and 'image' not in update_fields):
+        return
+    saved = sender.objects.filter(pk=instance.pk).values_list(
+        'image', flat=True).first()
+    if saved != instance.image.name:
+        instance.image_variants_ready = False
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(sender, instance, raw=False, **kwargs):
+    if (not raw and instance.image and not instance.image_variants_ready
+            and instance.image_status == Recipe.IMAGE_READY):
+        schedule(instance, create_variants, instance.image.name)
+
+
+# sender: (model with counter, counter field, attribute with its pk)
+COUNTERS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe_id'),
+    ShoppingCart: (Recipe, 'in_carts_count', 'recipe_id'),
+    Recipe: (User, 'recipes_count', 'author_id'),
+    Subscription: (User, 'subscribers_count', 'author_id'),
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        model, field, attname = COUNTERS[sender]
+        change_counter(model, field, getattr(instance, attname), 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counter(sender, instance, **kwargs):
+    model, field, attname = COUNTERS[sender]
+    change_counter(model, field, getattr(instance, attname), -1)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_to_timelines(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out((instance,))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_timeline(sender, instance, **kwargs):
+    timeline.remove(instance.user_id, instance.author_id)
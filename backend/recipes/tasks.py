@@ -0,0 +1,157 @@
+"""
+Image processing pool.
+
+Uploaded images are decoded, verified and recompressed out of request
+thread. Recipe is saved with pending image first and gets ready (or failed)
+status when its job is done.
+"""
+import base64
+import binascii
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .images import delete_image, generate_variants
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix='recipe-images')
+_slots = threading.BoundedSemaphore(settings.IMAGE_PROCESSING_QUEUE_SIZE)
+
+
+def recompress(file, output):
+    """Verify image and save it to output again without metadata. Images
+    with transparency are kept in PNG, others are converted to JPEG."""
+    Image.open(file).verify()
+    file.seek(0)
+    image = ImageOps.exif_transpose(Image.open(file))
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image.save(output, 'PNG', optimize=True)
+        return 'png'
+    image.convert('RGB').save(output, 'JPEG', quality=90, optimize=True)
+    return 'jpg'
+
+
+def store_image(recipe_id, file):
+    """Recompress image from file object, save it with variants
+    and set it to recipe."""
+    with tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            dir=settings.FILE_UPLOAD_TEMP_DIR) as output:
+        try:
+            extension = recompress(file, output)
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            logger.warning(
+                'Image of recipe %s is rejected: %s', recipe_id, error)
+            Recipe.objects.filter(pk=recipe_id).update(
+                image_status=Recipe.IMAGE_FAILED, modified=timezone.now())
+            return False
+        output.seek(0)
+        name = default_storage.save(
+            f'recipes/{uuid.uuid4().hex}.{extension}', File(output))
+    ready = generate_variants(name)
+    recipes = Recipe.objects.filter(pk=recipe_id)
+    old_name = recipes.values_list('image', flat=True).first()
+    recipes.update(image=name, image_status=Recipe.IMAGE_READY,
+                   image_variants_ready=ready, modified=timezone.now())
+    if old_name:
+        transaction.on_commit(lambda: delete_unused_image(old_name))
+    return True
+
+
+def create_variants(recipe_id, name):
+    """Generate variants of image saved outside of the pool (admin,
+    import), unless recipe has got another image meanwhile."""
+    if not generate_variants(name):
+        return False
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants_ready=True, modified=timezone.now())
+    return True
+
+
+def delete_unused_image(name):
+    """Delete replaced image, unless other recipes (e.g. imported ones)
+    still use it."""
+    if not Recipe.objects.filter(image=name).exists():
+        delete_image(name)
+
+
+def process_image(recipe_id, data):
+    """Decode base64 image and store it."""
+    try:
+        content = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError) as error:
+        logger.warning('Image of recipe %s is rejected: %s', recipe_id, error)
+        Recipe.objects.filter(pk=recipe_id).update(
+            image_status=Recipe.IMAGE_FAILED, modified=timezone.now())
+        return False
+    return store_image(recipe_id, BytesIO(content))
+
+
+def process_image_file(recipe_id, path):
+    """Store image uploaded to temporary file and remove the file."""
+    try:
+        with open(path, 'rb') as file:
+            return store_image(recipe_id, file)
+    finally:
+        os.remove(path)
+
+
+def _run_job(job, *args):
+    try:
+        job(*args)
+    except Exception:
+        logger.exception('Image processing job failed')
+    finally:
+        connection.close()
+        _slots.release()
+
+
+def _submit(job, *args):
+    if not _slots.acquire(blocking=False):
+        # Pool is saturated, let the client wait instead of queueing
+        # unbounded amount of images in memory.
+        job(*args)
+        return
+    _executor.submit(_run_job, job, *args)
+
+
+def schedule(recipe, job, *args):
+    """Run job for recipe in pool once current transaction is committed.
+    Without IMAGE_PROCESSING_ASYNC job is run at once and recipe is
+    refreshed with its result."""
+    if not settings.IMAGE_PROCESSING_ASYNC:
+        job(recipe.pk, *args)
+        recipe.refresh_from_db(fields=(
+            'image', 'image_status', 'image_variants_ready', 'modified'))
+        return
+    transaction.on_commit(lambda: _submit(job, recipe.pk, *args))
+
+
+def schedule_upload(recipe, path):
+    """Mark recipe image pending and schedule processing of uploaded
+    file. File is removed if job is never run because of rollback."""
+    try:
+        with transaction.atomic():
+            recipe.image_status = Recipe.IMAGE_PENDING
+            recipe.save(update_fields=('image_status', 'modified'))
+            schedule(recipe, process_image_file, path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
@@ -0,0 +1,70 @@
+"""
+Feeds of recipes from followed authors, filled on write.
+
+Published recipe is copied to timelines of author's subscribers in
+batches, subscribing backfills latest recipes of the author and
+unsubscribing removes them. Every timeline is trimmed to FEED_LENGTH
+newest entries.
+"""
+from django.conf import settings
+from django.db import connection
+
+from users.models import Subscription
+from .importers import batched
+from .models import Recipe, TimelineEntry
+
+
+def trim(user_ids):
+    """Delete all but FEED_LENGTH newest entries of users' timelines."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    quote = connection.ops.quote_name
+    table = quote(TimelineEntry._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN ('
+            f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+            f'PARTITION BY user_id ORDER BY pub_date DESC, id DESC'
+            f') AS position FROM {table} WHERE user_id IN ({placeholders})'
+            f') AS ranked WHERE position > %s)',
+            (*user_ids, settings.FEED_LENGTH))
+
+
+def fan_out(recipes):
+    """Add recipes to timelines of their authors' subscribers."""
+    by_author = {}
+    for recipe in recipes:
+        by_author.setdefault(recipe.author_id, []).append(recipe)
+    for author_id, author_recipes in by_author.items():
+        subscribers = Subscription.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        for user_ids in batched(subscribers.iterator(),
+                                settings.FEED_BATCH_SIZE):
+            TimelineEntry.objects.bulk_create((
+                TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                              pub_date=recipe.pub_date)
+                for user_id in user_ids for recipe in author_recipes
+            ), ignore_conflicts=True)
+            trim(user_ids)
+
+
+def backfill(user_id, author_id):
+    """Add latest recipes of just followed author to user's timeline."""
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.FEED_LENGTH]
+    TimelineEntry.objects.bulk_create((
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+        for recipe_id, pub_date in recipes), ignore_conflicts=True)
+    trim((user_id,))
+
+
+def remove(user_id, author_id):
+    """Remove recipes of unfollowed author from user's timeline."""
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        recipe__in=Recipe.objects.filter(author_id=author_id).values('id')
+    ).delete()
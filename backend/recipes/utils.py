@@ -1,4 +1,9 @@
+import csv
+import hashlib
+import json
 import os
+from functools import lru_cache
+from io import BytesIO
 
 from reportlab.lib.colors import black, blue
 from reportlab.lib.pagesizes import A4
@@ -8,31 +13,49 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.core.cache import caches
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
 
+from .models import RecipeIngredient, ShoppingCart
+
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+
+FONT_NAME = 'PTAstraSans'
+MARKER_SYM = chr(8226)
+STREAM_CHUNK_SIZE = 2000
+
+
+@lru_cache(maxsize=None)
+def get_font():
+    """Parse and register TTF font once per process."""
+    ttf_file = os.path.join(settings.FONTS_PATH, 'PTAstraSans-Regular.ttf')
+    pdfmetrics.registerFont(TTFont(FONT_NAME, ttf_file, 'UTF-8'))
+    return FONT_NAME
 
-def generate_PDF(ingredient_list):
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = ('attachment; '
-                                       'filename="shopping_list.pdf"')
-    folder = settings.FONTS_PATH
-    ttf_file = os.path.join(folder, 'PTAstraSans-Regular.ttf')
-    pdfmetrics.registerFont(TTFont('PTAstraSans', ttf_file, 'UTF-8'))
 
-    doc = canvas.Canvas(response, pagesize=A4)
+@lru_cache(maxsize=None)
+def get_logo():
+    """Read and decode logo once per process."""
+    logo = ImageReader(os.path.join(settings.FONTS_PATH, 'logo.png'))
+    logo.getRGBData()
+    return logo
 
-    logo_path = os.path.join(folder, 'logo.png')
-    logo = ImageReader(logo_path)
-    doc.drawImage(logo, 30, 710, mask='auto')
+
+def draw_header(doc, font):
+    """Draw static page header with font and logo loaded once per
+    process."""
+    doc.drawImage(get_logo(), 30, 710, mask='auto')
 
     doc.setFillColor(blue)
     doc.drawString(270, 820, ('http://odolisk.ru'))
 
     doc.setFillColor(black)
-    doc.setFont('PTAstraSans', 32)
+    doc.setFont(font, 32)
     doc.drawString(250, 770, 'Foodgram')
 
-    doc.setFont('PTAstraSans', 18)
+    doc.setFont(font, 18)
     doc.drawString(170, 720, 'сайт вкусных рецептов для програмистов')
 
     doc.setDash([1, 1, 3, 3, 1, 4, 4, 1], 0)
@@ -41,26 +64,124 @@ def generate_PDF(ingredient_list):
 
     doc.setDash(1, 0)
     doc.setFillColor(black)
-    doc.setFont('PTAstraSans', 24)
+    doc.setFont(font, 24)
     doc.drawString(120, 630, 'Список необходимых ингредиентов')
 
     doc.setLineWidth(2)
     doc.line(120, 620, 490, 620)
 
-    doc.setFont('PTAstraSans', 16)
+
+def generate_PDF(ingredient_list):
+    buffer = BytesIO()
+    font = get_font()
+    doc = canvas.Canvas(buffer, pagesize=A4)
+    draw_header(doc, font)
+
+    doc.setFillColor(black)
+    doc.setFont(font, 16)
     height = 570
-    marker_sym = chr(8226)
     for ingredient in ingredient_list:
         name = ingredient['ingredient__name']
         mes_unit = ingredient['ingredient__measurement_unit']
         amount = ingredient['ingredient_sum']
-        list_elem = f'{marker_sym} {name} - {amount} {mes_unit}'
+        list_elem = f'{MARKER_SYM} {name} - {amount} {mes_unit}'
         doc.drawString(75, height, list_elem)
         height -= 20
         if height <= 20:
             doc.showPage()
-            doc.setFont('PTAstraSans', 16)
+            doc.setFont(font, 16)
             height = 800
     doc.showPage()
     doc.save()
+    return buffer.getvalue()
+
+
+def shopping_list_cache_key(user_id):
+    return f'shopping-list-{user_id}'
+
+
+def get_cart_fingerprint(user):
+    """Hash of recipes in user's cart with their ingredients versions."""
+    cart = ShoppingCart.objects.filter(user=user).order_by(
+        'recipe_id').values_list('recipe_id', 'recipe__ingredients_version')
+    return hashlib.md5(repr(list(cart)).encode()).hexdigest()
+
+
+def get_shopping_list_PDF(user):
+    """Return rendered shopping list of user. Rendered PDF is cached
+    until recipes in cart or their ingredients change."""
+    cache = caches['shopping_lists']
+    key = shopping_list_cache_key(user.id)
+    fingerprint = get_cart_fingerprint(user)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    content = generate_PDF(get_shopping_list(user))
+    cache.set(key, (fingerprint, content))
+    return content
+
+
+def get_shopping_list(user):
+    """Ingredients from user's cart with amounts summed up."""
+    return RecipeIngredient.objects.filter(
+        recipe__id__in=user.shopping_user.values('recipe_id')
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        ingredient_sum=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+class Echo:
+    """File-like object for csv.writer, returns written row."""
+    def write(self, value):
+        return value
+
+
+def stream_txt(ingredient_list):
+    for ingredient in ingredient_list:
+        yield (f'{MARKER_SYM} {ingredient["ingredient__name"]} - '
+               f'{ingredient["ingredient_sum"]} '
+               f'{ingredient["ingredient__measurement_unit"]}\n')
+
+
+def stream_csv(ingredient_list):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredient_list:
+        yield writer.writerow((ingredient['ingredient__name'],
+                               ingredient['ingredient__measurement_unit'],
+                               ingredient['ingredient_sum']))
+
+
+def stream_json(ingredient_list):
+    separator = '['
+    for ingredient in ingredient_list:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['ingredient_sum']
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_STREAMS = {
+    'txt': (stream_txt, 'text/plain; charset=utf-8'),
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'json': (stream_json, 'application/json'),
+}
+
+
+def stream_shopping_list(user, file_format):
+    """Stream shopping list as txt, csv or json. Rows are read through
+    server-side cursor where database supports it."""
+    stream, content_type = SHOPPING_LIST_STREAMS[file_format]
+    ingredients = get_shopping_list(user).iterator(
+        chunk_size=STREAM_CHUNK_SIZE)
+    response = StreamingHttpResponse(stream(ingredients),
+                                     content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{file_format}"')
     return response
@@ -1,55 +1,162 @@
-from rest_framework import permissions, viewsets
+import hashlib
+
+from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 
-from django.db.models import Sum
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from django_filters.rest_framework import DjangoFilterBackend
 
-from foodgram_api.mixins import CreateDeleteObjMixin
-from foodgram_api.pagination import CustomPagination
+from foodgram_api.filters import StableOrderingFilter
+from foodgram_api.mixins import CreateDeleteObjMixin, VersionedCacheMixin
+from foodgram_api.pagination import RecipePagination
 from .filters import IngredientStartFilter, RecipeFilter
-from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+from .images import UPLOAD_CHUNK_SIZE, UploadError, save_upload
+from .indexes import get_ingredient_index
+from .models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                     TimelineEntry)
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FavoriteSerializer,
-                          IngredientSerializer, RecipeCreateSerializer,
-                          RecipeShowSerializer,
-                          ShoppingCartSerializer,
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .commons import ShortRecipeSerializer
+from .serializers import (IngredientSerializer, RecipeCreateSerializer,
+                          RecipeListSerializer, RecipeShowSerializer,
                           TagSerializer)
-from .utils import generate_PDF
+from .tasks import schedule_upload
+from .utils import (INGREDIENTS_VERSION, TAGS_VERSION, get_shopping_list_PDF,
+                    stream_shopping_list)
 
 
 class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filterset_class = RecipeFilter
+    filter_backends = (DjangoFilterBackend, StableOrderingFilter)
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
     permission_classes = (IsAuthorOrReadOnly,)
     http_method_names = ('get', 'post', 'put', 'patch', 'delete')
 
+    def get_queryset(self):
+        if self.action == 'list':
+            return Recipe.objects.values_for_display(self.request.user)
+        if (self.request.method in permissions.SAFE_METHODS
+                or self.action == 'image'):
+            return Recipe.objects.for_display(self.request.user)
+        return Recipe.objects.with_flags(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        serializer = RecipeListSerializer(
+            page, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            state = Recipe.objects.get_state(request.user, kwargs['pk'])
+        except (TypeError, ValueError):
+            state = None
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = quote_etag(hashlib.md5(repr(state).encode()).hexdigest())
+        last_modified = int(state[0].timestamp())
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=last_modified if request.user.is_anonymous else None)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeShowSerializer
         return RecipeCreateSerializer
 
+    @action(methods=('put', 'post'), detail=True,
+            parser_classes=(MultiPartParser,))
+    def image(self, request, pk):
+        """
+        Upload recipe image as raw request body (PUT with image/* content
+        type) or as "image" field of multipart form. Upload is written
+        to disk in chunks and processed in image processing pool.
+        """
+        recipe = self.get_object()
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        # body may be a bit larger than image because of multipart headers
+        if (int(request.META.get('CONTENT_LENGTH') or 0)
+                > max_size + UPLOAD_CHUNK_SIZE):
+            raise ValidationError({'image': [
+                f'Размер изображения не должен превышать {max_size} байт.']})
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('image')
+            if upload is None:
+                raise ValidationError({'image': ['Обязательное поле.']})
+            chunks = upload.chunks(UPLOAD_CHUNK_SIZE)
+        elif request.stream is not None:
+            chunks = iter(
+                lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b'')
+        else:
+            chunks = ()
+        try:
+            path = save_upload(chunks, max_size)
+        except UploadError as error:
+            raise ValidationError({'image': [str(error)]})
+        schedule_upload(recipe, path)
+        serializer = RecipeShowSerializer(
+            recipe, context=self.get_serializer_context())
+        if recipe.image_status == Recipe.IMAGE_PENDING:
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.data)
+
     @action(methods=('get',), detail=False,
             permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """Recipes of followed authors, newest first. Read from user's
+        timeline, which is filled when recipes are published."""
+        entries = TimelineEntry.objects.filter(
+            user=request.user).order_by('-pub_date', '-id')
+        page = self.paginate_queryset(entries)
+        recipes = Recipe.objects.for_display(request.user).in_bulk(
+            [entry.recipe_id for entry in page])
+        serializer = RecipeShowSerializer(
+            [recipes[entry.recipe_id] for entry in page
+             if entry.recipe_id in recipes],
+            many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=False,
+            permission_classes=[permissions.IsAuthenticated],
+            renderer_classes=(PDFRenderer, PlainTextRenderer,
+                              CSVRenderer, JSONRenderer))
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__id__in=request.user.shopping_user.values('recipe_id')
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            ingredient_sum=Sum('amount'))
-        return generate_PDF(ingredients)
+        if request.accepted_renderer.format != PDFRenderer.format:
+            return stream_shopping_list(
+                request.user, request.accepted_renderer.format)
+        response = HttpResponse(get_shopping_list_PDF(request.user),
+                                content_type='application/pdf')
+        response['Content-Disposition'] = ('attachment; '
+                                           'filename="shopping_list.pdf"')
+        return response
 
     @action(methods=('get', 'delete'), detail=True,
             permission_classes=[permissions.IsAuthenticated])
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'GET':
             data = {
-                'serializer': ShoppingCartSerializer,
-                'id': recipe.id,
+                'obj_model': ShoppingCart,
+                'subj': get_object_or_404(Recipe, id=pk),
+                'serializer': ShortRecipeSerializer,
                 'err_msg': 'Рецепт уже находится в списке покупок.',
                 'field_name': 'recipe'
             }
@@ -57,7 +164,7 @@ class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
         data = {
             'obj_model': ShoppingCart,
             'subj_model': Recipe,
-            'id': recipe.id,
+            'id': pk,
             'err_msg': 'В списке покупок нет такого рецепта.',
             'success_msg': 'Рецепт успешно удалён из списка покупок.',
             'field_name': 'recipe'
@@ -67,11 +174,11 @@ class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
     @action(methods=('get', 'delete'), detail=True,
             permission_classes=[permissions.IsAuthenticated])
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'GET':
             data = {
-                'serializer': FavoriteSerializer,
-                'id': recipe.id,
+                'obj_model': Favorite,
+                'subj': get_object_or_404(Recipe, id=pk),
+                'serializer': ShortRecipeSerializer,
                 'err_msg': 'Рецепт уже находится в избранном.',
                 'field_name': 'recipe'
             }
@@ -79,24 +186,60 @@ class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
         data = {
             'obj_model': Favorite,
             'subj_model': Recipe,
-            'id': recipe.id,
+            'id': pk,
             'err_msg': 'В избранном нет такого рецепта.',
             'success_msg': 'Рецепт успешно удалён из избранного.',
             'field_name': 'recipe'
         }
         return self.delete_obj(request, data)
 
+    @action(methods=('post', 'delete'), detail=False,
+            url_path='shopping_cart',
+            permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        data = {
+            'obj_model': ShoppingCart,
+            'subj_model': Recipe,
+            'field_name': 'recipe',
+            'counter': 'in_carts_count'
+        }
+        return self.change_objs(request, data)
+
+    @action(methods=('post', 'delete'), detail=False,
+            url_path='favorite',
+            permission_classes=[permissions.IsAuthenticated])
+    def favorite_batch(self, request):
+        data = {
+            'obj_model': Favorite,
+            'subj_model': Recipe,
+            'field_name': 'recipe',
+            'counter': 'favorites_count'
+        }
+        return self.change_objs(request, data)
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
+    version_name = TAGS_VERSION
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
     http_method_names = ('get',)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
+    version_name = INGREDIENTS_VERSION
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
     filterset_class = IngredientStartFilter
     http_method_names = ('get',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(self.search, request, name)
+
+    def search(self, request, name):
+        return Response(get_ingredient_index().search(
+            name, settings.INGREDIENT_SEARCH_LIMIT))
@@ -0,0 +1,87 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from rest_framework.test import APIClient
+
+from django.core.cache import caches
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(settings, tmp_path):
+    settings.SHARED_STATE_DIR = str(tmp_path)
+    for cache in caches.all():
+        cache.clear()
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(
+        email='user@foodgram.ru', username='user',
+        first_name='User', last_name='Userov', password='Test0112')
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def staff_client(user):
+    user.is_staff = True
+    user.save()
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def make_image(size=(1600, 900), file_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(buffer, file_format)
+    return buffer.getvalue()
+
+
+def create_dataset(user, size):
+    """Create size authors with size recipes each. User follows every
+    author, has every recipe in favorites and in shopping cart."""
+    tags = [
+        Tag.objects.create(
+            name=f'Тег {i}', color=f'#0000{i:02d}', slug=f'tag{i}')
+        for i in range(3)]
+    ingredients = [
+        Ingredient.objects.create(name=f'Ингредиент {i}',
+                                  measurement_unit='г')
+        for i in range(size)]
+    for i in range(size):
+        author = User.objects.create_user(
+            email=f'author{i}@foodgram.ru', username=f'author{i}',
+            first_name='Author', last_name=str(i), password='Test0112')
+        Subscription.objects.create(user=user, author=author)
+        for j in range(size):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {i}-{j}',
+                image='recipes/image.png', text='Текст', cooking_time=5)
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=j + 1)
+                for ingredient in ingredients)
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+    return Recipe.objects.first()
+
+
+@pytest.fixture(params=(2, 8), ids=('small', 'large'))
+def dataset(request, user):
+    return create_dataset(user, request.param)
@@ -0,0 +1,37 @@
+import pytest
+
+from django.test import Client
+
+from recipes.models import Ingredient
+
+CHANGELISTS = (
+    'recipes/recipe', 'recipes/ingredient', 'recipes/favorite',
+    'recipes/shoppingcart', 'recipes/tag', 'users/user',
+    'users/subscription',
+)
+
+
+@pytest.fixture
+def admin_client(user):
+    user.is_staff = user.is_superuser = True
+    user.save()
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('changelist', CHANGELISTS)
+def test_changelist_queries(admin_client, dataset, changelist,
+                            django_assert_max_num_queries):
+    with django_assert_max_num_queries(10):
+        response = admin_client.get(f'/admin/{changelist}/')
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_recipe_change_page(admin_client, dataset):
+    Ingredient.objects.create(name='Лишний ингредиент', measurement_unit='г')
+    response = admin_client.get(f'/admin/recipes/recipe/{dataset.id}/change/')
+    assert response.status_code == 200
+    assert 'Лишний ингредиент' not in response.content.decode()
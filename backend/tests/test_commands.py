@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from recipes.models import Ingredient, Recipe, Tag
+from .conftest import make_image
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def catalog():
+    Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+    Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    Ingredient.objects.create(name='Яйцо', measurement_unit='шт')
+    Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+
+def recipe_row(number, author):
+    return {
+        'author': author, 'name': f'Рецепт {number}', 'text': 'Текст',
+        'cooking_time': 10, 'image': 'recipes/image.png',
+        'tags': ['breakfast', 'lunch'],
+        'ingredients': [
+            {'name': 'Яйцо', 'measurement_unit': 'шт', 'amount': 2},
+            {'name': 'Соль', 'measurement_unit': 'г', 'amount': 1},
+        ],
+    }
+
+
+def test_import_recipes_jsonl(user, catalog, tmp_path):
+    path = tmp_path / 'recipes.jsonl'
+    rows = [recipe_row(number, user.email) for number in range(25)]
+    rows[3]['tags'] = ['unknown']
+    path.write_text('\n'.join(json.dumps(row, ensure_ascii=False)
+                              for row in rows), encoding='utf-8')
+    call_command('import_recipes', str(path), batch_size=10)
+    assert Recipe.objects.count() == 24
+    recipe = Recipe.objects.get(name='Рецепт 7')
+    assert recipe.author == user
+    assert set(recipe.tags.values_list('slug', flat=True)) == {
+        'breakfast', 'lunch'}
+    assert dict(recipe.recipe_for_ingredient.values_list(
+        'ingredient__name', 'amount')) == {'Яйцо': 2, 'Соль': 1}
+    assert recipe.pub_date is not None
+
+
+def test_import_recipes_variants(user, catalog, tmp_path):
+    default_storage.save('recipes/imported.png', ContentFile(make_image()))
+    row = recipe_row(1, user.email)
+    row['image'] = 'recipes/imported.png'
+    path = tmp_path / 'recipes.jsonl'
+    path.write_text(json.dumps(row), encoding='utf-8')
+    call_command('import_recipes', str(path), variants=True)
+    assert Recipe.objects.get().image_variants_ready
+
+
+def test_import_recipes_csv(user, catalog, tmp_path):
+    path = tmp_path / 'recipes.csv'
+    row = recipe_row(1, '')
+    path.write_text(
+        'author,name,text,cooking_time,image,tags,ingredients\n'
+        ',{name},{text},{cooking_time},{image},"breakfast,lunch",'
+        '"{ingredients}"\n'.format(
+            ingredients=json.dumps(row.pop('ingredients'), ensure_ascii=False
+                                   ).replace('"', '""'), **row),
+        encoding='utf-8')
+    call_command('import_recipes', str(path), author=user.email)
+    recipe = Recipe.objects.get()
+    assert recipe.tags.count() == 2
+    assert recipe.ingredients.count() == 2
+
+
+def test_import_ingredients_fixture(settings):
+    Ingredient.objects.create(name='абрикосовое варенье',
+                              measurement_unit='г')
+    path = os.path.join(
+        os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.xml')
+    call_command('import_ingredients', path)
+    count = Ingredient.objects.count()
+    assert count > 2000
+    call_command('import_ingredients', path)
+    assert Ingredient.objects.count() == count
+
+
+def test_import_ingredients_csv(tmp_path):
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('name,measurement_unit\nСоль,г\nСоль,щепотка\nСоль,г\n',
+                    encoding='utf-8')
+    call_command('import_ingredients', str(path))
+    assert set(Ingredient.objects.values_list(
+        'name', 'measurement_unit')) == {('Соль', 'г'), ('Соль', 'щепотка')}
@@ -0,0 +1,217 @@
+import json
+
+import pytest
+
+from django.core.management import call_command
+from django.db import connection
+
+from foodgram_api import mixins
+from foodgram_api.mixins import delete_by_filter, insert_or_ignore
+from recipes import signals
+from recipes.models import Favorite, Recipe
+from users.models import Subscription, User
+from .conftest import create_dataset
+
+pytestmark = pytest.mark.django_db
+
+
+def test_counters_follow_changes(user, user_client):
+    recipe = create_dataset(user, 2)
+    author = recipe.author
+    assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1)
+    assert (author.recipes_count, author.subscribers_count) == (2, 1)
+
+    user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+    user_client.delete(f'/api/users/{author.id}/subscribe/')
+    recipe.refresh_from_db()
+    author.refresh_from_db()
+    assert recipe.favorites_count == 0
+    assert author.subscribers_count == 0
+
+    user_client.get(f'/api/users/{author.id}/subscribe/')
+    recipe.delete()
+    author.refresh_from_db()
+    assert (author.recipes_count, author.subscribers_count) == (1, 1)
+
+
+def test_subscriptions_show_counter(user, user_client):
+    create_dataset(user, 2)
+    results = user_client.get('/api/users/subscriptions/').json()['results']
+    assert [author['recipes_count'] for author in results] == [2, 2]
+
+
+def test_recount_counters(user):
+    recipe = create_dataset(user, 2)
+    Recipe.objects.update(favorites_count=10)
+    User.objects.filter(pk=recipe.author_id).update(recipes_count=0)
+    call_command('recount_counters')
+    assert set(Recipe.objects.values_list(
+        'favorites_count', flat=True)) == {1}
+    assert User.objects.get(pk=recipe.author_id).recipes_count == 2
+
+
+def test_ordering_by_counter(user, user_client):
+    create_dataset(user, 2)
+    popular = Recipe.objects.last()
+    Favorite.objects.create(user=popular.author, recipe=popular)
+    results = user_client.get(
+        '/api/recipes/?ordering=-favorites_count').json()['results']
+    assert results[0]['id'] == popular.id
+    ids = [recipe['id'] for recipe in results[1:]]
+    assert ids == sorted(ids, reverse=True)
+
+
+@pytest.mark.parametrize('action', ('favorite', 'shopping_cart'))
+def test_recipe_toggle_outcomes(user, user_client, action):
+    recipe = create_dataset(user, 2)
+    url = f'/api/recipes/{recipe.id}/{action}/'
+    response = user_client.get(url)
+    assert response.status_code == 400
+    assert list(response.json()) == ['non_field_errors']
+    assert user_client.delete(url).status_code == 204
+    assert user_client.delete(url).status_code == 400
+    assert user_client.delete(
+        f'/api/recipes/999/{action}/').status_code == 404
+    response = user_client.get(url)
+    assert response.status_code == 201
+    assert response.json()['id'] == recipe.id
+    recipe.refresh_from_db()
+    assert getattr(recipe, {'favorite': 'favorites_count',
+                            'shopping_cart': 'in_carts_count'}[action]) == 1
+
+
+def test_subscribe_outcomes(user, user_client):
+    recipe = create_dataset(user, 2)
+    url = f'/api/users/{recipe.author_id}/subscribe/'
+    assert user_client.get(url).status_code == 400
+    assert user_client.delete(url).status_code == 204
+    response = user_client.get(url)
+    assert response.status_code == 201
+    assert response.json()['is_subscribed'] is True
+    assert response.json()['recipes_count'] == 2
+    response = user_client.get(f'/api/users/{user.id}/subscribe/')
+    assert response.status_code == 400
+    assert 'author' in response.json()
+
+
+def test_delete_fixture_row(user, user_client, tmp_path):
+    recipe = create_dataset(user, 2)
+    Favorite.objects.filter(recipe=recipe).delete()
+    fixture = tmp_path / 'favorites.json'
+    fixture.write_text(json.dumps([{
+        'model': 'recipes.favorite',
+        'fields': {'user': user.id, 'recipe': recipe.id}}]))
+    call_command('loaddata', str(fixture), verbosity=0)
+    # raw saves aren't counted
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 0
+    response = user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 204
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 0
+
+
+def test_insert_or_ignore(user):
+    recipe = create_dataset(user, 2)
+    Favorite.objects.filter(recipe=recipe).delete()
+    assert insert_or_ignore(Favorite(user=user, recipe=recipe))
+    assert not insert_or_ignore(Favorite(user=user, recipe=recipe))
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_toggle_rolled_back_with_signals(user, monkeypatch):
+    recipe = create_dataset(user, 2)
+    Favorite.objects.filter(recipe=recipe).delete()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError
+
+    monkeypatch.setattr(signals, 'change_counter', fail)
+    with pytest.raises(RuntimeError):
+        insert_or_ignore(Favorite(user=user, recipe=recipe))
+    assert not Favorite.objects.filter(recipe=recipe).exists()
+    Favorite.objects.bulk_create([Favorite(user=user, recipe=recipe)])
+    with pytest.raises(RuntimeError):
+        delete_by_filter(Favorite, user_id=user.id, recipe_id=recipe.id)
+    assert Favorite.objects.filter(recipe=recipe).exists()
+
+
+@pytest.mark.parametrize('action, counter', (
+    ('favorite', 'favorites_count'),
+    ('shopping_cart', 'in_carts_count'),
+))
+def test_batch_actions(user, user_client, action, counter,
+                       django_assert_max_num_queries):
+    create_dataset(user, 2)
+    first, second, *_ = Recipe.objects.order_by('id')
+    url = f'/api/recipes/{action}/'
+    ids = [first.id, second.id, 999]
+    with django_assert_max_num_queries(6):
+        response = user_client.delete(url, {'ids': ids}, format='json')
+    assert response.json()['results'] == [
+        {'id': first.id, 'status': 'removed'},
+        {'id': second.id, 'status': 'removed'},
+        {'id': 999, 'status': 'not_found'},
+    ]
+    first.refresh_from_db()
+    assert getattr(first, counter) == 0
+    response = user_client.delete(url, {'ids': [first.id]}, format='json')
+    assert response.json()['results'] == [
+        {'id': first.id, 'status': 'missing'}]
+    with django_assert_max_num_queries(6):
+        response = user_client.post(url, {'ids': [first.id, first.id]},
+                                    format='json')
+    assert response.json()['results'] == [
+        {'id': first.id, 'status': 'added'}]
+    response = user_client.post(url, {'ids': ids[:2]}, format='json')
+    assert [result['status'] for result in response.json()['results']] == [
+        'exists', 'added']
+    first.refresh_from_db()
+    assert getattr(first, counter) == 1
+
+
+@pytest.mark.parametrize('returning', (True, False))
+def test_batch_concurrent_removal(user, user_client, monkeypatch, returning):
+    recipe = create_dataset(user, 2)
+    monkeypatch.setattr(mixins, 'supports_returning', lambda _: returning)
+    removing = []
+
+    def remove_concurrently(execute, sql, params, many, context):
+        # another request removes the link right before our DELETE
+        if sql.startswith('DELETE') and not removing:
+            removing.append(sql)
+            delete_by_filter(Favorite, user_id=user.id, recipe_id=recipe.id)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(remove_concurrently):
+        response = user_client.delete('/api/recipes/favorite/',
+                                      {'ids': [recipe.id]}, format='json')
+    assert response.json()['results'] == [
+        {'id': recipe.id, 'status': 'missing'}]
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
+
+
+def test_batch_validation(user_client):
+    response = user_client.post('/api/recipes/favorite/', {'ids': []},
+                                format='json')
+    assert response.status_code == 400
+    response = user_client.post('/api/recipes/favorite/', {'ids': ['x']},
+                                format='json')
+    assert response.status_code == 400
+
+
+def test_saves_keep_counters(user):
+    recipe = create_dataset(user, 2)
+    stale_recipe = Recipe.objects.get(pk=recipe.pk)
+    stale_author = User.objects.get(pk=recipe.author_id)
+    # links created while objects are being edited
+    Favorite.objects.create(user=recipe.author, recipe=recipe)
+    insert_or_ignore(Subscription(user=recipe.author, author=user))
+    stale_recipe.name = 'Новое имя'
+    stale_recipe.save()
+    stale_author.set_password('New0112pass')
+    stale_author.save()
+    recipe.refresh_from_db()
+    assert (recipe.name, recipe.favorites_count) == ('Новое имя', 2)
+    assert User.objects.get(pk=user.pk).subscribers_count == 1
@@ -0,0 +1,56 @@
+import pytest
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription, User
+from .conftest import create_dataset
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/feed/'
+
+
+def feed_ids(client, query=''):
+    return [recipe['id']
+            for recipe in client.get(URL + query).json()['results']]
+
+
+def test_feed_shows_followed_authors(user, user_client):
+    create_dataset(user, 2)
+    stranger = User.objects.create_user(
+        email='stranger@foodgram.ru', username='stranger',
+        first_name='Stranger', last_name='Strangerov', password='Test0112')
+    Recipe.objects.create(author=stranger, name='Чужой', text='Текст',
+                          image='recipes/image.png', cooking_time=5)
+    expected = list(Recipe.objects.exclude(author=stranger).order_by(
+        '-pub_date', '-id').values_list('id', flat=True))
+    assert feed_ids(user_client, '?limit=100') == expected
+    assert feed_ids(user_client, '?limit=100&cursor=') == expected
+
+
+def test_feed_follows_subscriptions(user, user_client):
+    create_dataset(user, 2)
+    author = Recipe.objects.first().author
+    Subscription.objects.filter(user=user, author=author).delete()
+    assert not TimelineEntry.objects.filter(
+        user=user, recipe__author=author).exists()
+
+    user_client.get(f'/api/users/{author.id}/subscribe/')
+    assert TimelineEntry.objects.filter(
+        user=user, recipe__author=author).count() == 2
+
+    recipe = Recipe.objects.create(author=author, name='Новый', text='Текст',
+                                   image='recipes/image.png', cooking_time=5)
+    assert feed_ids(user_client)[0] == recipe.id
+
+
+def test_feed_is_trimmed(user, settings):
+    settings.FEED_LENGTH = 3
+    create_dataset(user, 2)
+    newest = list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+        'id', flat=True)[:3])
+    assert sorted(TimelineEntry.objects.filter(user=user).values_list(
+        'recipe_id', flat=True)) == sorted(newest)
+
+
+def test_feed_requires_auth(client):
+    assert client.get(URL).status_code == 401
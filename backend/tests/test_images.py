@@ -0,0 +1,271 @@
+import base64
+import os
+import time
+from datetime import timedelta
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+
+from recipes import signals, tasks, views
+from recipes.images import get_variant_name
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.serializers import RecipeCreateSerializer
+from .conftest import make_image
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe_data():
+    tag = Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+    ingredient = Ingredient.objects.create(name='Яйцо', measurement_unit='шт')
+    image = base64.b64encode(make_image()).decode()
+    return {
+        'name': 'Яичница', 'text': 'Пожарить', 'cooking_time': 5,
+        'tags': [tag.id], 'ingredients': [{'id': ingredient.id, 'amount': 2}],
+        'image': f'data:image/png;base64,{image}',
+    }
+
+
+def test_variants_created(user_client, recipe_data):
+    response = user_client.post('/api/recipes/', recipe_data, format='json')
+    assert response.status_code == 201
+    recipe = Recipe.objects.get()
+    for variant, size in (('thumbnail', (96, 96)), ('card', (480, 270)),
+                          ('full', (1200, 675))):
+        for extension, file_format in (('jpg', 'JPEG'), ('webp', 'WEBP')):
+            name = get_variant_name(recipe.image.name, variant, extension)
+            with default_storage.open(name) as file:
+                image = Image.open(file)
+                assert (image.format, image.size) == (file_format, size)
+    variants = response.json()['image_variants']
+    assert variants['card']['webp'].startswith('http://testserver/media_web/')
+    assert variants['card']['webp'].endswith('/card.webp')
+    short = user_client.get(f'/api/recipes/{recipe.id}/favorite/').json()
+    assert short['image_variants'] == variants
+
+
+def test_image_recompressed(user_client, recipe_data):
+    response = user_client.post('/api/recipes/', recipe_data, format='json')
+    assert response.json()['image_status'] == Recipe.IMAGE_READY
+    recipe = Recipe.objects.get()
+    assert recipe.image.name.endswith('.jpg')
+    with default_storage.open(recipe.image.name) as file:
+        assert Image.open(file).size == (1600, 900)
+
+
+def test_broken_image_fails(user_client, recipe_data):
+    broken = base64.b64encode(b'not an image').decode()
+    recipe_data['image'] = f'data:image/png;base64,{broken}'
+    response = user_client.post('/api/recipes/', recipe_data, format='json')
+    assert response.status_code == 201
+    assert response.json()['image_status'] == Recipe.IMAGE_FAILED
+    assert response.json()['image'] is None
+
+
+def test_image_size_limited(user_client, recipe_data, settings):
+    settings.MAX_IMAGE_UPLOAD_SIZE = 100
+    response = user_client.post('/api/recipes/', recipe_data, format='json')
+    assert response.status_code == 400
+    assert 'image' in response.json()
+    assert not Recipe.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_image_processed_in_pool(user_client, recipe_data, settings):
+    settings.IMAGE_PROCESSING_ASYNC = True
+    response = user_client.post('/api/recipes/', recipe_data, format='json')
+    assert response.status_code == 201
+    recipe = Recipe.objects.get()
+    for _ in range(100):
+        recipe.refresh_from_db()
+        if recipe.image_status != Recipe.IMAGE_PENDING:
+            break
+        time.sleep(0.05)
+    assert recipe.image_status == Recipe.IMAGE_READY
+    detail = user_client.get(f'/api/recipes/{recipe.id}/').json()
+    assert detail['image_status'] == Recipe.IMAGE_READY
+    assert detail['image'].endswith('.jpg')
+
+
+@pytest.fixture
+def recipe(user, recipe_data, user_client):
+    user_client.post('/api/recipes/', recipe_data, format='json')
+    return Recipe.objects.get()
+
+
+def test_raw_image_upload(user_client, recipe):
+    old_name = recipe.image.name
+    response = user_client.put(
+        f'/api/recipes/{recipe.id}/image/', make_image((800, 600), 'JPEG'),
+        content_type='image/jpeg')
+    assert response.status_code == 200
+    assert response.json()['image_status'] == Recipe.IMAGE_READY
+    recipe.refresh_from_db()
+    assert recipe.image.name != old_name
+    with default_storage.open(recipe.image.name) as file:
+        assert Image.open(file).size == (800, 600)
+    name = get_variant_name(recipe.image.name, 'card', 'webp')
+    assert default_storage.exists(name)
+
+
+def test_multipart_image_upload(user_client, recipe):
+    upload = BytesIO(make_image((300, 200)))
+    upload.name = 'photo.png'
+    response = user_client.post(f'/api/recipes/{recipe.id}/image/',
+                                {'image': upload}, format='multipart')
+    assert response.status_code == 200
+    recipe.refresh_from_db()
+    with default_storage.open(recipe.image.name) as file:
+        assert Image.open(file).size == (300, 200)
+
+
+def test_upload_format_sniffed(user_client, recipe):
+    response = user_client.put(f'/api/recipes/{recipe.id}/image/',
+                               b'<html>' * 10, content_type='image/png')
+    assert response.status_code == 400
+    recipe.refresh_from_db()
+    assert recipe.image_status == Recipe.IMAGE_READY
+
+
+def test_upload_size_limited(user_client, recipe, settings):
+    settings.MAX_IMAGE_UPLOAD_SIZE = 1000
+    response = user_client.put(
+        f'/api/recipes/{recipe.id}/image/',
+        make_image((800, 600), 'JPEG'), content_type='image/jpeg')
+    assert response.status_code == 400
+
+
+def test_upload_only_by_author(client, recipe):
+    response = client.put(f'/api/recipes/{recipe.id}/image/',
+                          make_image(), content_type='image/png')
+    assert response.status_code == 401
+
+
+def test_update_keeps_processed_image(user, recipe):
+    # image job finishes while recipe is being edited
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image='recipes/processed.jpg', image_status=Recipe.IMAGE_READY)
+    serializer = RecipeCreateSerializer(
+        recipe, data={'name': 'renamed'}, partial=True,
+        context={'request': SimpleNamespace(user=user)})
+    assert serializer.is_valid(), serializer.errors
+    serializer.save()
+    recipe.refresh_from_db()
+    assert recipe.name == 'renamed'
+    assert recipe.image.name == 'recipes/processed.jpg'
+    assert recipe.image_status == Recipe.IMAGE_READY
+
+
+def test_stale_pending_images_fail(recipe, settings):
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_status=Recipe.IMAGE_PENDING,
+        modified=timezone.now() - timedelta(
+            seconds=settings.IMAGE_PROCESSING_TIMEOUT + 1))
+    fresh = Recipe.objects.create(
+        author=recipe.author, name='Новый', text='Текст', cooking_time=5,
+        image='', image_status=Recipe.IMAGE_PENDING)
+    call_command('fail_stale_images')
+    recipe.refresh_from_db()
+    fresh.refresh_from_db()
+    assert recipe.image_status == Recipe.IMAGE_FAILED
+    assert fresh.image_status == Recipe.IMAGE_PENDING
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replaced_image_deleted(user_client, recipe):
+    old_name = recipe.image.name
+    old_variant = get_variant_name(old_name, 'card', 'webp')
+    assert default_storage.exists(old_variant)
+    user_client.put(
+        f'/api/recipes/{recipe.id}/image/', make_image((800, 600), 'JPEG'),
+        content_type='image/jpeg')
+    assert not default_storage.exists(old_name)
+    assert not default_storage.exists(old_variant)
+    recipe.refresh_from_db()
+    assert default_storage.exists(recipe.image.name)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shared_image_kept(user_client, recipe):
+    Recipe.objects.create(
+        author=recipe.author, name='Копия', text='Текст', cooking_time=5,
+        image=recipe.image.name)
+    user_client.put(
+        f'/api/recipes/{recipe.id}/image/', make_image((800, 600), 'JPEG'),
+        content_type='image/jpeg')
+    assert default_storage.exists(recipe.image.name)
+
+
+def test_upload_removed_on_rollback(user_client, recipe, monkeypatch):
+    paths = []
+    original = views.save_upload
+
+    def save_upload(*args):
+        paths.append(original(*args))
+        return paths[-1]
+
+    def schedule(*args):
+        raise RuntimeError
+
+    monkeypatch.setattr(views, 'save_upload', save_upload)
+    monkeypatch.setattr(tasks, 'schedule', schedule)
+    with pytest.raises(RuntimeError):
+        user_client.put(
+            f'/api/recipes/{recipe.id}/image/', make_image(),
+            content_type='image/png')
+    assert not os.path.exists(paths[0])
+
+
+def save_image(name):
+    return default_storage.save(name, ContentFile(make_image((200, 100))))
+
+
+def test_missing_variants_are_null(user_client, recipe):
+    # e.g. imported without --variants
+    Recipe.objects.filter(pk=recipe.pk).update(image_variants_ready=False)
+    detail = user_client.get(f'/api/recipes/{recipe.id}/').json()
+    listed = user_client.get('/api/recipes/').json()['results'][0]
+    assert detail['image'] and listed['image']
+    assert detail['image_variants'] is listed['image_variants'] is None
+
+
+def test_backfill_variants(user_client, recipe):
+    name = save_image('recipes/imported.png')
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image=name, image_variants_ready=False)
+    call_command('generate_image_variants')
+    assert default_storage.exists(get_variant_name(name, 'card', 'webp'))
+    detail = user_client.get(f'/api/recipes/{recipe.id}/').json()
+    assert detail['image_variants']['card']['webp'].endswith('/card.webp')
+
+
+def test_variants_made_in_pool(recipe, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(signals, 'schedule',
+                        lambda *args: scheduled.append(args))
+    Recipe.objects.filter(pk=recipe.pk).update(image_variants_ready=False)
+    recipe.refresh_from_db()
+    recipe.name = 'Новое имя'
+    recipe.save()
+    assert scheduled == [(recipe, tasks.create_variants, recipe.image.name)]
+    recipe.image_variants_ready = True
+    recipe.save()
+    assert len(scheduled) == 1
+
+
+def test_replaced_image_gets_variants(recipe):
+    # admin saves whole recipe with new file
+    recipe.image = save_image('recipes/admin.png')
+    recipe.save()
+    recipe.refresh_from_db()
+    assert recipe.image_variants_ready
+    assert default_storage.exists(
+        get_variant_name(recipe.image.name, 'card', 'webp'))
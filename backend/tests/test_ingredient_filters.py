@@ -0,0 +1,152 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from django.utils import timezone
+
+from recipes import indexes
+from recipes.indexes import RecipeIngredientIndex, get_recipe_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def pantry(user):
+    ingredients = {
+        name: Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('курица', 'рис', 'орехи', 'соль', 'лук')}
+
+    def create(name, *names):
+        recipe = Recipe.objects.create(
+            author=user, name=name, text='Текст', cooking_time=5,
+            image='recipes/image.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredients[name])
+            for name in names)
+        return recipe
+
+    recipes = {
+        'plov': create('Плов', 'курица', 'рис', 'лук', 'соль'),
+        'satsivi': create('Сациви', 'курица', 'орехи', 'соль'),
+        'rice': create('Рис', 'рис', 'соль'),
+        'onion': create('Лук', 'лук'),
+    }
+    return ingredients, recipes
+
+
+def get_ids(client, **params):
+    params = {name: ','.join(str(item.id) for item in value)
+              for name, value in params.items()}
+    response = client.get('/api/recipes/', {**params, 'limit': 100})
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+def test_include_and_exclude(client, pantry):
+    ingredients, recipes = pantry
+    assert set(get_ids(client, ingredients=[ingredients['курица']])) == {
+        recipes['plov'].id, recipes['satsivi'].id}
+    assert get_ids(
+        client, ingredients=[ingredients['курица'], ingredients['рис']],
+        exclude_ingredients=[ingredients['орехи']]) == [recipes['plov'].id]
+    assert set(get_ids(
+        client, exclude_ingredients=[ingredients['орехи']])) == {
+        recipes['plov'].id, recipes['rice'].id, recipes['onion'].id}
+
+
+def test_include_over_limit(client, pantry, settings):
+    ingredients, recipes = pantry
+    settings.INGREDIENT_FILTER_LIMIT = 1
+    assert set(get_ids(client, ingredients=[ingredients['рис']])) == {
+        recipes['plov'].id, recipes['rice'].id}
+    assert get_ids(
+        client, ingredients=[ingredients['рис'], ingredients['соль']],
+        exclude_ingredients=[ingredients['лук']]) == [recipes['rice'].id]
+    response = client.get('/api/recipes/', {
+        'ingredients': ingredients['соль'].id, 'limit': 1})
+    assert response.json()['count'] == 3
+
+
+def test_invalid_ids(client, pantry):
+    for params in ({'pantry': '1.7'}, {'ingredients': '1,x'},
+                   {'exclude_ingredients': '2,3.5'}):
+        response = client.get('/api/recipes/', params)
+        assert response.status_code == 400
+
+
+def test_pantry_ranking(client, pantry):
+    ingredients, recipes = pantry
+    found = get_ids(client, pantry=[
+        ingredients['рис'], ingredients['соль'], ingredients['лук']])
+    assert found == [recipes['plov'].id, recipes['rice'].id,
+                     recipes['onion'].id, recipes['satsivi'].id]
+    found = get_ids(client, pantry=[ingredients['рис'], ingredients['лук']],
+                    exclude_ingredients=[ingredients['курица']])
+    assert found == [recipes['onion'].id, recipes['rice'].id]
+
+
+def test_index_follows_writes(user_client, pantry, settings):
+    ingredients, recipes = pantry
+    settings.RECIPE_INDEX_MARGIN = 0
+    RecipeIngredientIndex.build(get_recipe_index().path)
+    satsivi = recipes['satsivi']
+    user_client.patch(f'/api/recipes/{satsivi.id}/', {
+        'ingredients': [{'id': ingredients['рис'].id, 'amount': 1}],
+        'tags': [], 'name': satsivi.name, 'text': satsivi.text,
+        'cooking_time': 5}, format='json')
+    assert set(get_ids(user_client, ingredients=[ingredients['рис']])) == {
+        recipes['plov'].id, recipes['rice'].id, satsivi.id}
+    assert satsivi.id not in get_ids(
+        user_client, ingredients=[ingredients['курица']])
+
+
+def age_index(monkeypatch, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(indexes, 'time', SimpleNamespace(time=lambda: now))
+
+
+def test_index_is_rebuilt(client, pantry, settings, monkeypatch):
+    ingredients, recipes = pantry
+    settings.RECIPE_INDEX_MAX_CHANGES = 1
+    stale = get_recipe_index()
+    Recipe.objects.update(modified=timezone.now())
+    age_index(monkeypatch, settings.RECIPE_INDEX_MARGIN)
+    assert get_ids(client, ingredients=[ingredients['орехи']]) == [
+        recipes['satsivi'].id]
+    index = get_recipe_index()
+    assert index.stamp != stale.stamp
+    assert list(index.get_recipes(ingredients['лук'].id)) == [
+        recipes['plov'].id, recipes['onion'].id]
+
+
+def test_index_rebuilt_once(client, pantry, settings, monkeypatch):
+    ingredients, _ = pantry
+    settings.RECIPE_INDEX_MAX_CHANGES = 2
+    builds = []
+    build = RecipeIngredientIndex.build
+
+    def count_build(cls, path):
+        builds.append(path)
+        build(path)
+
+    monkeypatch.setattr(RecipeIngredientIndex, 'build',
+                        classmethod(count_build))
+    get_recipe_index()
+    Recipe.objects.update(modified=timezone.now())
+    # young index is not rebuilt whatever number of changes
+    for _ in range(3):
+        get_ids(client, ingredients=[ingredients['рис']])
+    assert len(builds) == 1
+    age_index(monkeypatch, settings.RECIPE_INDEX_MARGIN)
+    for _ in range(5):
+        get_ids(client, ingredients=[ingredients['рис']])
+    assert len(builds) == 2
+
+
+def test_nothing_found(client, pantry):
+    ingredients, _ = pantry
+    missing = Ingredient.objects.create(name='шафран', measurement_unit='г')
+    assert get_ids(client, ingredients=[missing]) == []
+    assert get_ids(client, pantry=[missing]) == []
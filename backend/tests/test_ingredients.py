@@ -0,0 +1,68 @@
+import pytest
+
+from foodgram_api.versions import bump_version, get_version
+from recipes.utils import INGREDIENTS_VERSION
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/ingredients/'
+
+
+@pytest.fixture
+def ingredients():
+    return Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit=unit) for name, unit in (
+            ('Сахар', 'г'), ('сахарная пудра', 'г'), ('Соль', 'г'),
+            ('Сахар', 'кг'), ('Молоко', 'мл'), ('сливки', 'мл')))
+
+
+def test_prefix_search(client, ingredients):
+    response = client.get(URL, {'name': 'САХ'})
+    assert [(item['name'], item['measurement_unit'])
+            for item in response.json()] == [
+        ('Сахар', 'г'), ('Сахар', 'кг'), ('сахарная пудра', 'г')]
+    assert client.get(URL, {'name': 'перец'}).json() == []
+
+
+def test_prefix_search_limit(client, ingredients, settings):
+    settings.INGREDIENT_SEARCH_LIMIT = 2
+    assert len(client.get(URL, {'name': 'с'}).json()) == 2
+
+
+def test_index_rebuilt_on_new_version(client, ingredients):
+    assert client.get(URL, {'name': 'мол'}).json()[0]['name'] == 'Молоко'
+    Ingredient.objects.create(name='Мёд', measurement_unit='г')
+    bump_version(INGREDIENTS_VERSION)
+    assert [item['name'] for item in client.get(
+        URL, {'name': 'м'}).json()] == ['Молоко', 'Мёд']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_catalog_change_bumps_version():
+    version = get_version(INGREDIENTS_VERSION)
+    Ingredient.objects.create(name='Мёд', measurement_unit='г')
+    assert get_version(INGREDIENTS_VERSION) != version
+
+
+@pytest.mark.parametrize('url', (
+    '/api/tags/', URL, f'{URL}?name=сах', URL + '{pk}/'))
+def test_conditional_get(client, ingredients, url,
+                         django_assert_num_queries):
+    url = url.format(pk=Ingredient.objects.first().pk)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'max-age' in response['Cache-Control']
+    with django_assert_num_queries(0):
+        cached = client.get(url)
+        not_modified = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert cached.json() == response.json()
+    assert not_modified.status_code == 304
+
+
+def test_etag_changes_with_version(client, ingredients):
+    etag = client.get(URL)['ETag']
+    bump_version(INGREDIENTS_VERSION)
+    response = client.get(URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
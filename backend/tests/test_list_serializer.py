@@ -0,0 +1,34 @@
+"""RecipeListSerializer must render exactly what RecipeShowSerializer
+renders for the same recipes."""
+import pytest
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Recipe
+from recipes.serializers import RecipeShowSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('query', (
+    'limit=100',
+    'limit=3&cursor=',
+    'limit=100&tags=tag1&tags=tag2',
+    'limit=100&ordering=-favorites_count',
+    'limit=100&search=рецепт',
+))
+@pytest.mark.parametrize('anonymous', (False, True), ids=('user', 'anon'))
+def test_list_matches_show_serializer(client, user_client, dataset, query,
+                                      anonymous):
+    Recipe.objects.filter(pk=dataset.id).update(image='')
+    client = client if anonymous else user_client
+    response = client.get(f'/api/recipes/?{query}')
+    assert response.status_code == 200
+    request = response.renderer_context['request']
+    ids = [recipe['id'] for recipe in response.data['results']]
+    assert ids
+    recipes = Recipe.objects.for_display(request.user).in_bulk(ids)
+    expected = RecipeShowSerializer(
+        [recipes[pk] for pk in ids], many=True, context={'request': request})
+    renderer = JSONRenderer()
+    assert (renderer.render(response.data['results'])
+            == renderer.render(expected.data))
@@ -0,0 +1,130 @@
+"""Every endpoint must issue a fixed number of SQL queries regardless of
+dataset and page size. Each test runs against a small and a large dataset
+with the same budget, so any N+1 regression fails here."""
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+LIMIT = 'limit=100'
+
+
+@pytest.mark.parametrize('url, budget', (
+    ('/api/recipes/', 5),
+    (f'/api/recipes/?{LIMIT}', 5),
+    (f'/api/recipes/?{LIMIT}&tags=tag0&tags=tag1', 6),
+    (f'/api/recipes/?{LIMIT}&author=1', 5),
+    (f'/api/recipes/?{LIMIT}&is_favorited=1', 5),
+    (f'/api/recipes/?{LIMIT}&is_in_shopping_cart=1', 5),
+    (f'/api/recipes/?{LIMIT}&is_favorited=1&is_in_shopping_cart=1'
+     '&tags=tag2', 6),
+    (f'/api/recipes/?{LIMIT}&cursor=', 4),
+    (f'/api/recipes/?{LIMIT}&count=false&page=2', 4),
+    (f'/api/recipes/?{LIMIT}&cursor=&tags=tag0&is_favorited=1', 5),
+    (f'/api/recipes/?{LIMIT}&search=рецепт', 5),
+    (f'/api/recipes/?{LIMIT}&search=рецепт&cursor=&tags=tag0', 6),
+    (f'/api/recipes/?{LIMIT}&ingredients=1,2&exclude_ingredients=3', 7),
+    (f'/api/recipes/?{LIMIT}&pantry=1,2,3&tags=tag0', 8),
+))
+def test_recipe_list(user_client, dataset, django_assert_max_num_queries,
+                     url, budget):
+    with django_assert_max_num_queries(budget):
+        response = user_client.get(url)
+    assert response.status_code == 200
+
+
+def test_recipe_list_anonymous(client, dataset,
+                               django_assert_max_num_queries):
+    with django_assert_max_num_queries(5):
+        response = client.get(f'/api/recipes/?{LIMIT}')
+    assert response.status_code == 200
+
+
+def test_recipe_detail(user_client, dataset, django_assert_max_num_queries):
+    url = f'/api/recipes/{dataset.id}/'
+    with django_assert_max_num_queries(5):
+        response = user_client.get(url)
+    assert response.status_code == 200
+    with django_assert_max_num_queries(1):
+        response = user_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('url, budget', (
+    (f'/api/recipes/feed/?{LIMIT}', 6),
+    (f'/api/recipes/feed/?{LIMIT}&cursor=', 5),
+))
+def test_feed(user_client, dataset, django_assert_max_num_queries, url,
+              budget):
+    with django_assert_max_num_queries(budget):
+        response = user_client.get(url)
+    assert response.status_code == 200
+
+
+def test_download_shopping_cart(user_client, dataset,
+                                django_assert_max_num_queries):
+    url = '/api/recipes/download_shopping_cart/'
+    with django_assert_max_num_queries(2):
+        response = user_client.get(url)
+    assert response.status_code == 200
+    with django_assert_max_num_queries(1):
+        cached = user_client.get(url)
+    assert cached.content == response.content
+
+
+@pytest.mark.parametrize('action', ('favorite', 'shopping_cart'))
+def test_recipe_toggles(user_client, dataset, django_assert_max_num_queries,
+                        action):
+    url = f'/api/recipes/{dataset.id}/{action}/'
+    with django_assert_max_num_queries(2):
+        response = user_client.delete(url)
+    assert response.status_code == 204
+    with django_assert_max_num_queries(3):
+        response = user_client.get(url)
+    assert response.status_code == 201
+
+
+@pytest.mark.parametrize('url', (
+    '/api/users/subscriptions/',
+    f'/api/users/subscriptions/?{LIMIT}',
+    f'/api/users/subscriptions/?{LIMIT}&recipes_limit=3',
+    f'/api/users/subscriptions/?{LIMIT}&cursor=',
+))
+def test_subscriptions(user_client, dataset, django_assert_max_num_queries,
+                       url):
+    with django_assert_max_num_queries(3):
+        response = user_client.get(url)
+    assert response.status_code == 200
+
+
+def test_subscribe(user_client, dataset, django_assert_max_num_queries):
+    url = f'/api/users/{dataset.author_id}/subscribe/'
+    with django_assert_max_num_queries(3):
+        response = user_client.delete(url)
+    assert response.status_code == 204
+    with django_assert_max_num_queries(7):
+        response = user_client.get(url)
+    assert response.status_code == 201
+
+
+def test_user_list(staff_client, dataset, django_assert_max_num_queries):
+    with django_assert_max_num_queries(2):
+        response = staff_client.get(f'/api/users/?{LIMIT}')
+    assert response.status_code == 200
+
+
+def test_user_detail(user_client, dataset, django_assert_max_num_queries):
+    with django_assert_max_num_queries(1):
+        response = user_client.get(f'/api/users/{dataset.author_id}/')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('url', (
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/ingredients/?name=инг',
+))
+def test_reference_data(client, dataset, django_assert_max_num_queries, url):
+    with django_assert_max_num_queries(1):
+        response = client.get(url)
+    assert response.status_code == 200
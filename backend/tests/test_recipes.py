@@ -0,0 +1,255 @@
+import base64
+
+import pytest
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from .conftest import create_dataset, make_image
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe(user):
+    return create_dataset(user, 2)
+
+
+def get_etag(client, recipe):
+    response = client.get(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 200
+    assert response['Last-Modified']
+    return response['ETag']
+
+
+def is_modified(client, recipe, etag):
+    response = client.get(f'/api/recipes/{recipe.id}/',
+                          HTTP_IF_NONE_MATCH=etag)
+    return response.status_code == 200
+
+
+def test_not_modified(user_client, recipe):
+    etag = get_etag(user_client, recipe)
+    assert not is_modified(user_client, recipe, etag)
+
+
+@pytest.mark.parametrize('change', (
+    lambda recipe: recipe.save(),
+    lambda recipe: recipe.tags.remove(Tag.objects.first()),
+    lambda recipe: rename(Tag.objects.filter(recipe=recipe).first(), 'name'),
+    lambda recipe: RecipeIngredient.objects.filter(
+        recipe=recipe).first().delete(),
+    lambda recipe: rename(Ingredient.objects.filter(
+        ingredient_for_recipe__recipe=recipe).first(), 'measurement_unit'),
+    lambda recipe: rename(recipe.author, 'first_name'),
+    lambda recipe: Favorite.objects.filter(recipe=recipe).delete(),
+))
+def test_modified(user_client, recipe, change):
+    etag = get_etag(user_client, recipe)
+    change(recipe)
+    assert is_modified(user_client, recipe, etag)
+
+
+def rename(obj, field):
+    setattr(obj, field, 'новое')
+    obj.save()
+
+
+def change_password(user):
+    user.set_password('New0112pass')
+    user.save()
+
+
+@pytest.mark.parametrize('change', (
+    lambda recipe: Tag.objects.filter(recipe=recipe).first().save(),
+    lambda recipe: Ingredient.objects.filter(
+        ingredient_for_recipe__recipe=recipe).first().save(),
+    lambda recipe: recipe.author.save(),
+    lambda recipe: change_password(recipe.author),
+))
+def test_not_modified_by_hidden_changes(user_client, recipe, change):
+    modified = Recipe.objects.get(pk=recipe.pk).modified
+    change(recipe)
+    assert Recipe.objects.get(pk=recipe.pk).modified == modified
+
+
+def test_not_found(user_client):
+    assert user_client.get('/api/recipes/999/').status_code == 404
+    assert user_client.get('/api/recipes/abc/').status_code == 404
+
+
+def walk(client, url, link):
+    """Follow pagination links, return ids of every page and last url."""
+    pages = []
+    while url:
+        response = client.get(url).json()
+        assert 'count' not in response
+        pages.append([item['id'] for item in response['results']])
+        last_url, url = url, response[link]
+    return pages, last_url
+
+
+@pytest.mark.parametrize('limit', (1, 3, 4, 100))
+def test_keyset_pagination(user_client, user, limit):
+    create_dataset(user, 3)
+    expected = list(Recipe.objects.order_by(
+        '-pub_date', '-id').values_list('id', flat=True))
+    pages, last_url = walk(
+        user_client, f'/api/recipes/?cursor=&limit={limit}', 'next')
+    assert sum(pages, []) == expected
+    assert all(len(page) == limit for page in pages[:-1])
+    pages, _ = walk(user_client, last_url, 'previous')
+    assert sum(reversed(pages), []) == expected
+
+
+def test_keyset_invalid_cursor(user_client):
+    assert user_client.get('/api/recipes/?cursor=abc').status_code == 404
+
+
+def test_max_page_size(user_client, user):
+    create_dataset(user, 11)
+    response = user_client.get('/api/recipes/?limit=1000').json()
+    assert len(response['results']) == 100
+    response = user_client.get('/api/recipes/?cursor=&limit=1000').json()
+    assert len(response['results']) == 100
+
+
+def test_count_is_cached(user_client, user, django_assert_num_queries):
+    create_dataset(user, 2)
+    url = '/api/recipes/?tags=tag0&limit=2'
+    count = user_client.get(url).json()['count']
+    with django_assert_num_queries(5):
+        response = user_client.get(f'{url}&page=2')
+    assert response.json()['count'] == count == 4
+
+
+def test_pagination_without_count(user_client, user):
+    create_dataset(user, 3)
+    expected = list(Recipe.objects.values_list('id', flat=True))
+    pages, last_url = walk(
+        user_client, '/api/recipes/?count=false&limit=4', 'next')
+    assert sum(pages, []) == expected
+    assert last_url.endswith('page=3')
+    pages, _ = walk(user_client, last_url, 'previous')
+    assert sum(reversed(pages), []) == expected
+
+
+@pytest.fixture
+def own_recipe(user, recipe):
+    Recipe.objects.filter(pk=recipe.pk).update(author=user)
+    recipe.refresh_from_db()
+    return recipe
+
+
+def get_amounts(recipe):
+    return dict(recipe.recipe_for_ingredient.values_list(
+        'ingredient_id', 'amount'))
+
+
+def test_patch_without_ingredients(user_client, own_recipe):
+    amounts = get_amounts(own_recipe)
+    response = user_client.patch(f'/api/recipes/{own_recipe.id}/',
+                                 {'name': 'Новое имя'}, format='json')
+    assert response.status_code == 200
+    assert response.json()['name'] == 'Новое имя'
+    assert get_amounts(own_recipe) == amounts
+
+
+def test_ingredients_diff(user_client, own_recipe):
+    amounts = get_amounts(own_recipe)
+    kept, removed = amounts
+    added = Ingredient.objects.create(name='Новый', measurement_unit='г').id
+    rows = dict(own_recipe.recipe_for_ingredient.values_list(
+        'ingredient_id', 'id'))
+    version = own_recipe.ingredients_version
+    response = user_client.patch(
+        f'/api/recipes/{own_recipe.id}/',
+        {'ingredients': [{'id': kept, 'amount': amounts[kept] + 10},
+                         {'id': added, 'amount': 3}]},
+        format='json')
+    assert response.status_code == 200
+    assert get_amounts(own_recipe) == {kept: amounts[kept] + 10, added: 3}
+    new_rows = dict(own_recipe.recipe_for_ingredient.values_list(
+        'ingredient_id', 'id'))
+    assert new_rows[kept] == rows[kept]
+    own_recipe.refresh_from_db()
+    assert own_recipe.ingredients_version == version + 1
+
+
+def test_unchanged_ingredients_keep_version(user_client, own_recipe):
+    amounts = get_amounts(own_recipe)
+    version = own_recipe.ingredients_version
+    response = user_client.patch(
+        f'/api/recipes/{own_recipe.id}/',
+        {'ingredients': [{'id': pk, 'amount': amount}
+                         for pk, amount in amounts.items()]},
+        format='json')
+    assert response.status_code == 200
+    own_recipe.refresh_from_db()
+    assert own_recipe.ingredients_version == version
+
+
+def make_recipe_data(ingredients, tags):
+    image = base64.b64encode(make_image((100, 100))).decode()
+    return {
+        'name': 'Салат', 'text': 'Нарезать', 'cooking_time': 10,
+        'image': f'data:image/png;base64,{image}',
+        'tags': [tag.id for tag in tags],
+        'ingredients': [{'id': ingredient.id, 'amount': 2}
+                        for ingredient in ingredients],
+    }
+
+
+def test_create_queries(user_client, django_assert_max_num_queries):
+    ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                             measurement_unit='г')
+                   for i in range(30)]
+    tags = [Tag.objects.create(name=f'Тег {i}', color=f'#0000{i:02d}',
+                               slug=f'tag{i}') for i in range(3)]
+    with django_assert_max_num_queries(12):
+        response = user_client.post(
+            '/api/recipes/', make_recipe_data(ingredients, tags),
+            format='json')
+    assert response.status_code == 201
+    recipe = Recipe.objects.get()
+    data = response.json()
+    detail = user_client.get(f'/api/recipes/{recipe.id}/').json()
+    data['ingredients'].sort(key=lambda ingredient: ingredient['id'])
+    detail['ingredients'].sort(key=lambda ingredient: ingredient['id'])
+    assert data == detail
+    assert len(data['ingredients']) == 30
+
+
+def test_create_response_order(user_client):
+    ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                             measurement_unit='г')
+                   for i in range(3)]
+    tags = [Tag.objects.create(name=f'Тег {i}', color=f'#0000{i:02d}',
+                               slug=f'tag{i}') for i in range(3)]
+    response = user_client.post(
+        '/api/recipes/', make_recipe_data(ingredients[::-1], tags[::-1]),
+        format='json')
+    assert response.status_code == 201
+    data = response.json()
+    detail = user_client.get(f'/api/recipes/{data["id"]}/').json()
+    assert data == detail
+    assert [tag['id'] for tag in data['tags']] == [tag.id for tag in tags]
+
+
+def test_update_response(user_client, own_recipe):
+    detail = user_client.get(f'/api/recipes/{own_recipe.id}/').json()
+    response = user_client.patch(f'/api/recipes/{own_recipe.id}/',
+                                 {'cooking_time': 42}, format='json')
+    detail['cooking_time'] = 42
+    assert response.json() == detail
+
+
+def test_create_unknown_ids(user_client):
+    ingredient = Ingredient.objects.create(name='Соль', measurement_unit='г')
+    tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    data = make_recipe_data([ingredient], [tag])
+    data['tags'].append(999)
+    data['ingredients'].append({'id': 998, 'amount': 1})
+    response = user_client.post('/api/recipes/', data, format='json')
+    assert response.status_code == 400
+    assert set(response.json()) == {'tags', 'ingredients'}
+    assert not Recipe.objects.exists()
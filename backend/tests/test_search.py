@@ -0,0 +1,59 @@
+import pytest
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipes(user):
+    def create(name, text):
+        return Recipe.objects.create(
+            author=user, name=name, text=text, cooking_time=5,
+            image='recipes/image.png')
+    return {
+        'borsch': create('Борщ', 'Свекла, капуста и картофель.'),
+        'salad': create('Салат', 'Капуста, морковь. Капуста свежая.'),
+        'pie': create('Пирог с капустой', 'Тесто и капуста.'),
+        'soup': create('Суп', 'Картофель и морковь.'),
+    }
+
+
+def search(client, query):
+    response = client.get('/api/recipes/', {'search': query, 'limit': 100})
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+def test_search_matches_all_words(client, recipes):
+    assert search(client, 'морковь картофель') == [recipes['soup'].id]
+    assert search(client, 'борщ') == [recipes['borsch'].id]
+    assert search(client, 'ананас') == []
+
+
+def test_search_is_ranked(client, recipes):
+    found = search(client, 'капуста')
+    assert set(found) == {recipes['borsch'].id, recipes['salad'].id,
+                          recipes['pie'].id}
+    assert found[0] == recipes['salad'].id
+
+
+def test_search_follows_changes(client, recipes):
+    soup = recipes['soup']
+    soup.name = 'Гороховый суп'
+    soup.save()
+    assert search(client, 'гороховый') == [soup.id]
+    soup.delete()
+    assert search(client, 'гороховый') == []
+
+
+@pytest.mark.parametrize('query', ('"', 'NEAR(', '*', 'a OR', ''))
+def test_search_ignores_syntax(client, recipes, query):
+    assert len(search(client, query)) in (0, len(recipes))
+
+
+def test_search_with_cursor_keeps_ranking(client, recipes):
+    response = client.get('/api/recipes/',
+                          {'search': 'капуста', 'cursor': ''})
+    assert response.status_code == 200
+    assert response.json()['results'][0]['id'] == recipes['salad'].id
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from recipes.models import Recipe, RecipeIngredient, ShoppingCart
+from .conftest import create_dataset
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.fixture
+def recipe(user):
+    return create_dataset(user, 2)
+
+
+def test_repeat_download_is_cached(user_client, recipe,
+                                   django_assert_num_queries):
+    first = user_client.get(URL).content
+    with django_assert_num_queries(1):
+        assert user_client.get(URL).content == first
+
+
+def test_cart_change_invalidates_pdf(user_client, user, recipe,
+                                     django_assert_num_queries):
+    first = user_client.get(URL).content
+    ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
+    with django_assert_num_queries(2):
+        assert user_client.get(URL).content != first
+
+
+def test_ingredients_change_invalidates_pdf(user_client, recipe,
+                                            django_assert_num_queries):
+    first = user_client.get(URL).content
+    RecipeIngredient.objects.filter(recipe=recipe).first().delete()
+    assert Recipe.objects.get(pk=recipe.pk).ingredients_version == 1
+    with django_assert_num_queries(2):
+        assert user_client.get(URL).content != first
+
+
+def test_ingredient_rename_invalidates_pdf(user_client, recipe,
+                                           django_assert_num_queries):
+    user_client.get(URL)
+    ingredient = recipe.ingredients.first()
+    ingredient.measurement_unit = 'кг'
+    ingredient.save()
+    with django_assert_num_queries(2):
+        user_client.get(URL)
+
+
+def read_stream(response):
+    assert response.streaming
+    return b''.join(response.streaming_content).decode()
+
+
+def test_download_txt(user_client, recipe):
+    content = read_stream(user_client.get(f'{URL}?format=txt'))
+    assert content.splitlines()[0] == '• Ингредиент 0 - 6 г'
+
+
+def test_download_csv(user_client, recipe):
+    response = user_client.get(URL, HTTP_ACCEPT='text/csv')
+    assert read_stream(response).splitlines() == [
+        'name,measurement_unit,amount',
+        'Ингредиент 0,г,6',
+        'Ингредиент 1,г,6',
+    ]
+
+
+def test_download_json(user_client, recipe):
+    response = user_client.get(f'{URL}?format=json')
+    assert response['Content-Type'] == 'application/json'
+    assert json.loads(read_stream(response)) == [
+        {'name': 'Ингредиент 0', 'measurement_unit': 'г', 'amount': 6},
+        {'name': 'Ингредиент 1', 'measurement_unit': 'г', 'amount': 6},
+    ]
+
+
+def test_download_empty_json(user_client):
+    assert read_stream(user_client.get(f'{URL}?format=json')) == '[]'
+
+
+def test_download_requires_auth(client):
+    response = client.get(f'{URL}?format=csv')
+    assert response.status_code == 401
@@ -9,15 +9,22 @@ from .models import Subscription, User
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ('pk', 'username', 'email', 'first_name',
-                    'last_name', 'is_staff', 'is_superuser')
+                    'last_name', 'recipes_count', 'subscribers_count',
+                    'is_staff', 'is_superuser')
+    list_filter = ('is_staff', 'is_superuser', 'is_active')
     search_fields = ('email', 'username')
     ordering = ('pk',)
+    readonly_fields = ('recipes_count', 'subscribers_count')
+    show_full_result_count = False
 
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
     search_fields = ('user__username', 'author__username')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 admin.site.unregister(Group)
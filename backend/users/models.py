@@ -1,10 +1,12 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
-from django.db.models import F, Q
+from django.db.models import BooleanField, Exists, F, OuterRef, Q, Value
 
+from foodgram_api.counters import CountersMixin
 
-class User(AbstractUser):
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         'email',
         unique=True,
@@ -32,7 +34,18 @@ class User(AbstractUser):
         max_length=150,
         help_text='Обязательное поле. Не более 150 символов.'
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
+    counter_fields = ('recipes_count', 'subscribers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -74,3 +87,12 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f'{self.user.username} to {self.author.username}'
+
+
+def is_subscribed_expression(user, author_field='pk'):
+    """Expression for annotating Users (or rows referencing them by
+    author_field) with is_subscribed flag of given user."""
+    if user.is_anonymous:
+        return Value(False, output_field=BooleanField())
+    return Exists(Subscription.objects.filter(
+        user=user, author=OuterRef(author_field)))
@@ -4,7 +4,19 @@ from rest_framework import serializers
 from django.conf import settings
 
 from recipes.commons import ShortRecipeSerializer
-from .models import Subscription, User
+from .models import User
+
+
+def get_recipes_limit(request):
+    """Get recipes_limit query param or default if it's not valid."""
+    param = request.query_params.get('recipes_limit')
+    try:
+        recipes_limit = int(param)
+        if recipes_limit < 1:
+            raise ValueError
+    except (ValueError, TypeError):
+        recipes_limit = settings.DEFAULT_RECIPES_LIMIT
+    return recipes_limit
 
 
 class UserDetailSerializer(UserSerializer):
@@ -17,6 +29,9 @@ class UserDetailSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.subscribers.filter(author=obj).exists())
@@ -24,7 +39,6 @@ class UserDetailSerializer(UserSerializer):
 
 class ShowSubscriptionsSerializer(UserDetailSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -32,42 +46,6 @@ class ShowSubscriptionsSerializer(UserDetailSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        param = self.context.get('request').query_params.get(
-            'recipes_limit')
-        try:
-            recipes_limit = int(param)
-            if recipes_limit < 1:
-                raise ValueError
-        except (ValueError, TypeError):
-            recipes_limit = settings.DEFAULT_RECIPES_LIMIT
+        recipes_limit = get_recipes_limit(self.context.get('request'))
         recipes = obj.recipes.all()[:recipes_limit]
         return ShortRecipeSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-
-class SubscribeSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Subscription
-        fields = ('user', 'author')
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=('user', 'author'),
-                message='Подписка уже существует'
-            )
-        ]
-
-    def validate_author(self, value):
-        user = self.initial_data.get('user')
-        if user == value.id:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя')
-        return value
-
-    def to_representation(self, instance):
-        return ShowSubscriptionsSerializer(
-            instance.author,
-            context=self.context).data
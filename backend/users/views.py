@@ -1,19 +1,32 @@
+from django.db.models import OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from foodgram_api.filters import StableOrderingFilter
 from foodgram_api.mixins import CreateDeleteObjMixin
-from foodgram_api.pagination import CustomPagination
-from .models import Subscription, User
-from .serializers import ShowSubscriptionsSerializer, SubscribeSerializer
+from foodgram_api.pagination import UserPagination
+from recipes.models import Recipe
+from .models import Subscription, User, is_subscribed_expression
+from .serializers import ShowSubscriptionsSerializer, get_recipes_limit
 
 
 class FoodGramUserViewSet(CreateDeleteObjMixin, UserViewSet):
-    pagination_class = CustomPagination
+    pagination_class = UserPagination
+    filter_backends = (StableOrderingFilter,)
+    ordering_fields = ('recipes_count', 'subscribers_count')
     http_method_names = ('get', 'post', 'delete')
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = queryset.annotate(
+                is_subscribed=is_subscribed_expression(self.request.user))
+        return queryset
+
     def destroy(self, request, *args, **kwargs):
         data = {'detail': 'Метод \"DELETE\" не разрешен.'}
         return Response(data=data, status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -22,21 +35,26 @@ class FoodGramUserViewSet(CreateDeleteObjMixin, UserViewSet):
             url_path='subscribe',
             permission_classes=(permissions.IsAuthenticated,))
     def subscribe(self, request, id):
-        author = get_object_or_404(User, id=id)
         if request.method == 'GET':
+            author = get_object_or_404(User, id=id)
+            if author == request.user:
+                raise ValidationError(
+                    {'author': ['Нельзя подписаться на самого себя']})
+            author.is_subscribed = True
             data = {
-                'serializer': SubscribeSerializer,
-                'id': author.id,
-                'err_msg': 'exist',
+                'obj_model': Subscription,
+                'subj': author,
+                'serializer': ShowSubscriptionsSerializer,
+                'err_msg': 'Подписка уже существует',
                 'field_name': 'author'
             }
             return self.create_obj(request, data)
         data = {
             'obj_model': Subscription,
             'subj_model': User,
-            'id': author.id,
+            'id': id,
             'err_msg': 'Вы не подписаны на этого автора',
-            'success_msg': f'{request.user} отписан от {author}',
+            'success_msg': 'Подписка успешно удалена.',
             'field_name': 'author'
         }
         return self.delete_obj(request, data)
@@ -44,7 +62,15 @@ class FoodGramUserViewSet(CreateDeleteObjMixin, UserViewSet):
     @action(detail=False, methods=('GET',),
             permission_classes=(permissions.IsAuthenticated,))
     def subscriptions(self, request):
-        users = User.objects.filter(authors__user=request.user)
+        last_recipes = Recipe.objects.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:get_recipes_limit(request)]))
+        users = User.objects.filter(
+            authors__user=request.user
+        ).annotate(
+            is_subscribed=is_subscribed_expression(request.user)
+        ).prefetch_related(Prefetch('recipes', queryset=last_recipes))
         page = self.paginator.paginate_queryset(users, request)
         serializer = ShowSubscriptionsSerializer(
             page,